@@ -0,0 +1,165 @@
+"""
+Expand street, name and direction abbreviations by looking up whole words.
+
+The string is split into words once and each word is resolved through
+tables built from `resources`, with the context rules the old alternation
+regexes encoded: 'St' before a saint, no expansion before an apostrophe,
+no directional after a period, apostrophe or a leading 'Avenue' or before
+a letter, 'Street' or 'Avenue', and 'SR <number>' as State Route.
+"""
+
+import string
+
+import regex
+
+from resources import direction_expand, name_expand, saints, street_expand
+
+# the same word characters the regex module uses for \b
+_word = regex.compile(r"\w+")
+
+_STREET = {key: value.title() for key, value in (name_expand | street_expand).items()}
+_DIRECTIONS = {key: value.title() for key, value in direction_expand.items()}
+_SAINTS = tuple(saint.upper() for saint in saints)
+_SAINT_LENGTH = max(len(saint) for saint in saints)
+# words that may need the directional or State Route pass
+_MARKERS = frozenset(_DIRECTIONS) | {"SR"}
+# any word worth a closer look
+_ANY = frozenset(_STREET) | _MARKERS | {"ST"}
+# what a case-insensitive [a-zA-Z] matches, long s and Kelvin sign included
+_LETTERS = frozenset(string.ascii_letters + "\u017f\u212a")
+_DIGITS = frozenset(string.digits)
+
+
+def _upper(word: str) -> str | None:
+    """Upper-case a word, or None if that changes its length."""
+    upper = word.upper()
+    return upper if len(upper) == len(word) else None
+
+
+def _words(value: str) -> tuple[str, bool]:
+    """Expand 'St' before saints and street and name abbreviations."""
+    pieces = []
+    last = 0
+    markers = False
+    for match in _word.finditer(value):
+        start, end = match.span()
+        upper = _upper(match.group())
+        if upper == "ST":
+            stop = end + 1 if value[end : end + 1] == "." else end
+            if value[stop : stop + 1] != " ":
+                continue
+            if start and not (
+                value[stop + 1 : stop + 1 + _SAINT_LENGTH].upper().startswith(_SAINTS)
+            ):
+                continue
+            pieces += [value[last:start], "Saint"]
+            last = stop
+        elif upper in _STREET:
+            after = value[end : end + 1]
+            if after == "'":
+                continue
+            # a period goes with the abbreviation unless an apostrophe follows it
+            stop = end
+            if after == "." and value[end + 1 : end + 2] != "'":
+                stop = end + 1
+            pieces += [value[last:start], _STREET[upper]]
+            last = stop
+        elif upper in _MARKERS:
+            markers = True
+    if not pieces:
+        return value, markers
+    pieces.append(value[last:])
+    return "".join(pieces), markers
+
+
+def _pair_end(value: str, words: list, i: int, second: tuple[str, ...]) -> int | None:
+    """Return where 'X.Y' ends if word `i` is followed by '.' and `second`."""
+    end = words[i].end()
+    if value[end : end + 1] != "." or i + 1 == len(words):
+        return None
+    following = words[i + 1]
+    if following.start() != end + 1 or _upper(following.group()) not in second:
+        return None
+    return following.end() if following.end() - following.start() == 1 else None
+
+
+def _direction_stop(value: str, end: int) -> int | None:
+    """Take a trailing period if allowed and check what follows the match."""
+    for stop in (end + 1, end) if value[end : end + 1] == "." else (end,):
+        after = value[stop : stop + 1]
+        if after in _LETTERS:
+            continue
+        if after == "." and value[stop + 1 : stop + 2] in _LETTERS:
+            continue
+        if value[stop : stop + 7].upper() in (" STREET", " AVENUE"):
+            continue
+        return stop
+    return None
+
+
+def _directions(value: str) -> str:
+    """Expand directionals that are neither part of a name nor a street."""
+    pieces = []
+    last = 0
+    words = list(_word.finditer(value))
+    for i, match in enumerate(words):
+        start, end = match.span()
+        upper = _upper(match.group())
+        if start < last or upper not in _DIRECTIONS:
+            continue
+        if start and value[start - 1] in ".'":
+            continue
+        if start == 7 and value[:7].upper() == "AVENUE ":
+            continue
+        ends = [end]
+        # 'N.E' is tried before 'N' alone
+        if upper in ("N", "S"):
+            ends.insert(0, _pair_end(value, words, i, ("E", "W")))
+        for core in ends:
+            stop = None if core is None else _direction_stop(value, core)
+            if stop is not None:
+                key = value[start:stop].upper().replace(".", "")
+                pieces += [value[last:start], _DIRECTIONS[key]]
+                last = stop
+                break
+    if not pieces:
+        return value
+    pieces.append(value[last:])
+    return "".join(pieces)
+
+
+def _state_routes(value: str) -> str:
+    """Expand 'SR' when a route number follows."""
+    pieces = []
+    last = 0
+    words = list(_word.finditer(value))
+    for i, match in enumerate(words):
+        start, end = match.span()
+        upper = _upper(match.group())
+        if start < last:
+            continue
+        if upper == "S":
+            end = _pair_end(value, words, i, ("R",))
+        elif upper != "SR":
+            continue
+        if end is None:
+            continue
+        stop = end + 1 if value[end : end + 1] == "." else end
+        if value[stop : stop + 1] == " " and value[stop + 1 : stop + 2] in _DIGITS:
+            pieces += [value[last:start], "State Route"]
+            last = stop
+    if not pieces:
+        return value
+    pieces.append(value[last:])
+    return "".join(pieces)
+
+
+def expand(value: str) -> str:
+    """Expand saints, street and name abbreviations, directionals and 'SR'."""
+    # most values hold no abbreviation at all
+    if _ANY.isdisjoint(_word.findall(value.upper())):
+        return value
+    value, markers = _words(value)
+    if markers:
+        value = _state_routes(_directions(value))
+    return value
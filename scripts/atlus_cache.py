@@ -0,0 +1,101 @@
+"""Keep Atlus results on disk so unchanged values are not sent again."""
+
+import json
+import os
+import sqlite3
+import time
+from typing import Any
+
+CACHE_PATH = "scripts/json/atlus.sqlite"
+
+
+def normalize_input(value: str) -> str:
+    """Collapse the whitespace differences that do not change an Atlus result."""
+    return " ".join(str(value).split())
+
+
+class AtlusCache:
+    """SQLite store of Atlus results keyed by field type and input string."""
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        ttl: float = 90 * 24 * 3600,
+        max_entries: int = 1_000_000,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                field TEXT, input TEXT, result TEXT, updated REAL,
+                PRIMARY KEY (field, input)
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_updated ON results (updated)"
+        )
+
+    def get_many(self, field: str, inputs: list[str]) -> dict[str, dict[str, Any]]:
+        """Return the fresh cached results for the given normalized inputs."""
+        found: dict[str, dict[str, Any]] = {}
+        oldest = time.time() - self.ttl
+        unique = list(dict.fromkeys(inputs))
+        # stay below SQLite's bound parameter limit
+        for start in range(0, len(unique), 500):
+            chunk = unique[start : start + 500]
+            rows = self._conn.execute(
+                f"""SELECT input, result FROM results
+                WHERE field = ? AND updated >= ?
+                AND input IN ({",".join("?" * len(chunk))})""",
+                [field, oldest, *chunk],
+            )
+            found.update((value, json.loads(result)) for value, result in rows)
+
+        self.hits += sum(1 for value in inputs if value in found)
+        self.misses += sum(1 for value in inputs if value not in found)
+        return found
+
+    def put_many(self, field: str, results: dict[str, dict[str, Any]]) -> None:
+        """Store results for normalized inputs and enforce the size cap."""
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (
+                    (field, value, json.dumps(result), now)
+                    for value, result in results.items()
+                ),
+            )
+            self.prune()
+
+    def prune(self) -> None:
+        """Drop expired entries, then the oldest ones beyond `max_entries`."""
+        self._conn.execute(
+            "DELETE FROM results WHERE updated < ?", (time.time() - self.ttl,)
+        )
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                """DELETE FROM results WHERE rowid IN (
+                    SELECT rowid FROM results ORDER BY updated LIMIT ?
+                )""",
+                (count - self.max_entries,),
+            )
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._conn.close()
+
+    def summary(self, field: str) -> str:
+        """Describe cache use for console output."""
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups else 0.0
+        return (
+            f"Atlus {field} lookups: {self.hits} cache hits, {self.misses} misses "
+            f"({rate:.1f}% hit rate)"
+        )
@@ -0,0 +1,155 @@
+"""
+Send batches to the Atlus API concurrently.
+
+https://atlus.dev/
+"""
+
+import asyncio
+import random
+import time
+from itertools import batched
+from typing import Any, Protocol
+
+import aiohttp
+
+API_URL = "https://atlus.dev/api/"  # live at https://atlus.dev/
+CHUNK_SIZE = 10000
+
+# statuses worth retrying; anything else is returned to the caller as-is
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AtlusBackend(Protocol):
+    """Anything that can turn a batch of Atlus items into results."""
+
+    calls: int
+    errors: int
+
+    def request(
+        self, field: str, items: list[dict[str, str]]
+    ) -> list[dict[str, Any]]: ...
+
+
+class TokenBucket:
+    """Limit how often requests start, allowing short bursts."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, not {rate}")
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AtlusClient:
+    """Post Atlus batch requests over a pooled, rate-limited session."""
+
+    def __init__(
+        self,
+        api_url: str = API_URL,
+        concurrency: int = 4,
+        rate: float = 4.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 60,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        self.api_url = api_url
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.errors = 0
+
+    def request(self, field: str, items: list[dict[str, str]]) -> list[dict[str, Any]]:
+        """Send every item and return the results in completion order."""
+        if not items:
+            return []
+        return asyncio.run(self.request_async(field, items))
+
+    async def request_async(
+        self, field: str, items: list[dict[str, str]]
+    ) -> list[dict[str, Any]]:
+        """Send all chunks of `items` concurrently and merge their results."""
+        url = self.api_url + field + "/batch/"
+        bucket = TokenBucket(self.rate)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout
+        ) as session:
+
+            async def send(chunk: tuple[dict[str, str], ...]) -> list[dict[str, Any]]:
+                async with semaphore:
+                    return await self._post(session, bucket, url, list(chunk))
+
+            tasks = [
+                asyncio.create_task(send(chunk))
+                for chunk in batched(items, self.chunk_size)
+            ]
+            results = []
+            for task in asyncio.as_completed(tasks):
+                results.extend(await task)
+            return results
+
+    async def _post(
+        self,
+        session: aiohttp.ClientSession,
+        bucket: TokenBucket,
+        url: str,
+        chunk: list[dict[str, str]],
+    ) -> list[dict[str, Any]]:
+        """Post one chunk, retrying transient failures with backoff."""
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            self.calls += 1
+            retry_after = None
+            try:
+                async with session.post(url, json=chunk) as response:
+                    if response.status not in RETRY_STATUSES:
+                        resp = await response.json(content_type=None)
+                        try:
+                            return resp["data"]
+                        except (KeyError, TypeError) as e:
+                            self.errors += 1
+                            raise KeyError("Request failed") from e
+                    error: Exception = aiohttp.ClientResponseError(
+                        response.request_info,
+                        response.history,
+                        status=response.status,
+                        message=response.reason or "",
+                    )
+                    retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            self.errors += 1
+
+            if attempt >= self.retries:
+                raise error
+            delay = self.backoff * 2**attempt + random.uniform(0, self.backoff)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -10,94 +10,135 @@ python scripts/atlusfile.py -f output/ihop.geojson --field "address"
 ```
 """
 
-import json
 import os
 import sys
 import time
-from itertools import batched
 from typing import Any, Literal
 
-import requests
 
-
-from cli_utils import create_geojson_parser, process_input_output_paths
-
-
-API_URL = "https://atlus.dev/api/"  # live at https://atlus.dev/
+from atlus_cache import CACHE_PATH, AtlusCache, normalize_input
+from atlus_client import API_URL, AtlusBackend, AtlusClient
+from atlus_local import LocalAtlusBackend
+from cli_utils import (
+    create_geojson_parser,
+    is_geojson,
+    output_name,
+    process_input_output_paths,
+)
+from metrics import RunMetrics, add_metrics_arguments
+from serialize import dump, load
 
 
 def atlus_request(
-    content: list[dict[str, Any]], field: Literal["address", "phone"] = "address"
+    content: list[dict[str, Any]],
+    field: Literal["address", "phone"] = "address",
+    client: AtlusBackend | None = None,
+    cache: AtlusCache | None = None,
 ) -> list[dict[str, Any]]:
     """Process address fields using Atlus application."""
     fields = ["addr:street_address", "addr:full"] if field == "address" else ["phone"]
-    add = []
-    for obj in content:
+    # keyed by position, so features without an id or sharing one are kept apart
+    inputs: dict[str, str] = {}
+    for index, obj in enumerate(content):
         objt = obj["properties"]
-
         for tag in fields:
             if tag in objt:
-                add.append({"@id": obj["id"], "address": objt[tag]})
+                inputs[str(index)] = normalize_input(objt[tag])
                 break
 
-    add_chunks: list[tuple[dict[str, str]]] = list(batched(add, 10000))
-    fin_add = []
-    for chunk in add_chunks:
-        response = requests.post(
-            API_URL + field + "/batch/",
-            json=chunk,
-            timeout=10,
-            verify=bool(API_URL.startswith("https")),
+    cached = cache.get_many(field, list(inputs.values())) if cache else {}
+
+    # send each value missing from the cache once
+    add: dict[str, dict[str, str]] = {}
+    for key, value in inputs.items():
+        if value not in cached and value not in add:
+            add[value] = {"@id": key, "address": value}
+
+    # chunks may finish in any order, so match results back by id
+    client = client or AtlusClient()
+    fresh: dict[str, dict[str, Any]] = {}
+    for adds in client.request(field, list(add.values())):
+        value = inputs.get(adds.get("@id"))
+        if value is None:
+            # a result we cannot place is as good as a failed one
+            client.errors += 1
+            continue
+        fresh[value] = {k: v for k, v in adds.items() if k not in ["@id", "@removed"]}
+    if cache:
+        cache.put_many(
+            field,
+            {value: adds for value, adds in fresh.items() if not adds.get("error")},
         )
-        resp = response.json()
-        try:
-            fin_add.extend(resp["data"])
-        except KeyError as e:
-            raise KeyError("Request failed") from e
-        if len(fin_add) > 1:
-            time.sleep(0.25)
-
-    for i, adds in enumerate(fin_add):
-        props = content[i]["properties"]
+
+    results = cached | fresh
+    for key, value in inputs.items():
+        adds = results.get(value)
+        if adds is None:
+            continue
+        obj = content[int(key)]
+        props = obj["properties"]
         if not adds.get("error", None):
             for tag in fields:
                 props.pop(tag, None)
-            for tag in ["@id", "@removed"]:
-                adds.pop(tag, None)
 
-            content[i]["properties"] = props | adds
+            obj["properties"] = props | adds
     return content
 
 
 def process_file(
-    input_path: str, output_path: str, field: Literal["address", "phone"] = "address"
-) -> None:
+    input_path: str,
+    output_path: str,
+    field: Literal["address", "phone"] = "address",
+    client: AtlusBackend | None = None,
+    cache: AtlusCache | None = None,
+    fmt: str = "indent",
+) -> dict[str, int]:
     """
     Process a single GeoJSON file using Atlus request.
 
     :param input_path: Path to input GeoJSON file
     :param output_path: Path to output processed GeoJSON file
     :param field: Field to process (address or phone)
+    :param client: Atlus backend to send requests to
+    :param cache: Cache of earlier Atlus results to consult first
+    :param fmt: Output layout, one of `serialize.FORMATS`
+    :return: Features in and out, Atlus calls and errors, and cache hits
     """
     # Ensure output directory exists
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
     # Read input file
-    with open(input_path, "r") as f:
-        content = json.load(f)
+    content = load(input_path)
 
     # Process content
-    processed_content = atlus_request(content["features"], field)
+    client = client or AtlusClient()
+    calls, errors = client.calls, client.errors
+    hits = cache.hits if cache else 0
+    processed_content = atlus_request(content["features"], field, client, cache)
 
     content["features"] = processed_content
 
     # Write processed content
-    with open(output_path, "w") as f:
-        json.dump(content, f, indent=2)
+    dump(content, output_path, fmt)
+
+    return {
+        "features_in": len(processed_content),
+        "features_out": len(processed_content),
+        "atlus_calls": client.calls - calls,
+        "atlus_errors": client.errors - errors,
+        "cache_hits": (cache.hits if cache else 0) - hits,
+    }
 
 
 def process_directory(
-    input_dir: str, output_dir: str, field: Literal["address", "phone"] = "address"
+    input_dir: str,
+    output_dir: str,
+    field: Literal["address", "phone"] = "address",
+    client: AtlusBackend | None = None,
+    cache: AtlusCache | None = None,
+    fmt: str = "indent",
+    gzip: bool = False,
+    metrics: RunMetrics | None = None,
 ) -> None:
     """
     Process all GeoJSON files in a directory.
@@ -105,21 +146,35 @@ def process_directory(
     :param input_dir: Directory containing input GeoJSON files
     :param output_dir: Directory to save processed GeoJSON files
     :param field: Field to process (address or phone)
+    :param client: Atlus backend to send requests to
+    :param cache: Cache of earlier Atlus results to consult first
+    :param fmt: Output layout, one of `serialize.FORMATS`
+    :param gzip: Compress the outputs, adding .gz to their names
+    :param metrics: Run metrics to record each file in
     """
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
 
     # Process each GeoJSON file in the input directory
     for filename in os.listdir(input_dir):
-        if filename.endswith(".geojson"):
+        if is_geojson(filename):
             input_path = os.path.join(input_dir, filename)
-            output_path = os.path.join(output_dir, filename)
+            output_path = os.path.join(output_dir, output_name(filename, gzip))
 
+            start = time.perf_counter()
             try:
-                process_file(input_path, output_path, field)
+                counts = process_file(
+                    input_path, output_path, field, client, cache, fmt
+                )
                 print(f"Processed: {filename}")
+                if metrics:
+                    metrics.file(filename, counts, time.perf_counter() - start)
             except Exception as e:
                 print(f"Error processing {filename}: {e}", file=sys.stderr)
+                if metrics:
+                    metrics.file(
+                        filename, seconds=time.perf_counter() - start, status="failed"
+                    )
 
 
 def main():
@@ -137,9 +192,70 @@ def main():
         default=default_field,
         help=f"Field to process (default: {default_field})",
     )
+    parser.add_argument(
+        "--backend",
+        choices=["http", "local"],
+        default="http",
+        help="Send values to the Atlus API or parse them offline with the atlus library (default: http)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=0,
+        help="Worker processes for the local backend (default: 0, one per CPU)",
+    )
+    parser.add_argument(
+        "--api-url",
+        default=API_URL,
+        help=f"Atlus API base URL (default: {API_URL})",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of batch requests in flight (default: 4)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=4.0,
+        help="Maximum number of batch requests started per second (default: 4)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="Retries for timeouts, connection errors and 429/5xx responses (default: 3)",
+    )
+    parser.add_argument(
+        "--cache",
+        default=CACHE_PATH,
+        help=f"SQLite cache of earlier Atlus results (default: {CACHE_PATH})",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Send every value to the API without consulting the cache",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=90,
+        help="Days before a cached result is looked up again (default: 90)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1_000_000,
+        help="Maximum number of cached results (default: 1000000)",
+    )
+    add_metrics_arguments(parser)
 
     # Parse arguments
     args = parser.parse_args()
+    if args.rate <= 0:
+        parser.error("--rate must be positive")
 
     # Process input and output paths
     input_path, output_path = process_input_output_paths(args)
@@ -147,13 +263,61 @@ def main():
     # Determine processing field
     field = args.field
 
-    # Process single file or directory
-    if os.path.isfile(input_path):
-        process_file(input_path, output_path, field)
-        print(f"Processed file saved to: {output_path}")
+    client: AtlusBackend
+    if args.backend == "local":
+        client = LocalAtlusBackend(jobs=args.jobs)
     else:
-        process_directory(input_path, output_path, field)
-        print(f"Processed files saved to: {output_path}")
+        client = AtlusClient(
+            api_url=args.api_url,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            retries=args.retries,
+        )
+    cache = (
+        None
+        if args.no_cache
+        else AtlusCache(
+            args.cache, ttl=args.cache_ttl * 24 * 3600, max_entries=args.cache_size
+        )
+    )
+
+    metrics = RunMetrics.from_args(f"atlus_{field}", args)
+
+    # Process single file or directory
+    try:
+        if os.path.isfile(input_path):
+            name = os.path.basename(input_path)
+            start = time.perf_counter()
+            try:
+                counts = process_file(
+                    input_path, output_path, field, client, cache, args.format
+                )
+            except Exception:
+                metrics.file(name, seconds=time.perf_counter() - start, status="failed")
+                raise
+            metrics.file(name, counts, time.perf_counter() - start)
+            print(f"Processed file saved to: {output_path}")
+        else:
+            process_directory(
+                input_path,
+                output_path,
+                field,
+                client,
+                cache,
+                args.format,
+                args.gzip,
+                metrics,
+            )
+            print(f"Processed files saved to: {output_path}")
+    finally:
+        # a failed run still leaves its record and textfile behind
+        metrics.finish()
+
+    if cache:
+        print(cache.summary(field))
+        cache.close()
+    if isinstance(client, LocalAtlusBackend):
+        client.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,352 @@
+"""
+Measure pipeline throughput on the committed data/ corpus.
+
+Example usage:
+```
+python scripts/benchmark.py run -o build/bench.json
+python scripts/benchmark.py run --baseline build/bench.json
+python scripts/benchmark.py compare build/bench.json build/bench_new.json
+```
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import clean
+import nsi
+from atlus_client import AtlusClient
+from atlusfile import atlus_request
+
+DATA_DIR = "data"
+STRING_TAGS = ["name", "branch", "addr:city", "addr:street"]
+
+
+def load_corpus(data_dir: str = DATA_DIR) -> list[tuple[str, str]]:
+    """Return the path and raw text of every GeoJSON file under `data_dir`."""
+    corpus = []
+    for root, _, files in sorted(os.walk(data_dir)):
+        for file in sorted(files):
+            if file.endswith(".geojson") and not file.startswith("missing"):
+                path = os.path.join(root, file)
+                with open(path, "r", encoding="utf-8") as f:
+                    corpus.append((path, f.read()))
+    return corpus
+
+
+def result(seconds: float, items: int, size: int, unit: str) -> dict[str, float]:
+    """Express a measurement as throughput."""
+    return {
+        "seconds": round(seconds, 6),
+        "items": items,
+        "bytes": size,
+        "unit": unit,
+        "items_per_sec": round(items / seconds, 2) if seconds else 0.0,
+        "mb_per_sec": round(size / seconds / 1e6, 3) if seconds else 0.0,
+    }
+
+
+def best_of(repeat: int, func: Callable[[], tuple[float, int, int]]) -> tuple:
+    """Run a measurement several times and keep the fastest."""
+    return min((func() for _ in range(repeat)), key=lambda run: run[0])
+
+
+def bench_run(corpus: list[tuple[str, str]]) -> tuple[float, int, int]:
+    """Time `clean.run` on every file that cleans without errors."""
+    clean.normalize_cache.clear()
+    seconds = 0.0
+    items = size = 0
+    for _, text in corpus:
+        contents = json.loads(text)
+        # benchmark the cleaning work, not the already-cleaned skip
+        contents.pop("dataset_attributes", None)
+        start = time.perf_counter()
+        try:
+            clean.run(contents)
+        except (KeyError, ValueError, IndexError):
+            continue
+        seconds += time.perf_counter() - start
+        items += len(contents["features"])
+        size += len(text.encode())
+    return seconds, items, size
+
+
+def corpus_strings(corpus: list[tuple[str, str]]) -> list[str]:
+    """Collect the name-like values the normalization functions see."""
+    return [
+        feature["properties"][tag]
+        for _, text in corpus
+        for feature in json.loads(text).get("features", [])
+        for tag in STRING_TAGS
+        if isinstance(feature["properties"].get(tag), str)
+    ]
+
+
+def bench_strings(
+    strings: list[str], func: Callable[[str], str]
+) -> tuple[float, int, int]:
+    """Time a string function over every corpus value, uncached."""
+    start = time.perf_counter()
+    for value in strings:
+        func(value)
+    seconds = time.perf_counter() - start
+    return seconds, len(strings), sum(len(value.encode()) for value in strings)
+
+
+def bench_nsi_check(corpus: list[tuple[str, str]]) -> tuple[float, int, int]:
+    """Time `nsi_check` on every file with features; it reads only the first."""
+    seconds = 0.0
+    items = size = 0
+    for _, text in corpus:
+        contents = json.loads(text)
+        if not contents.get("features"):
+            continue
+        start = time.perf_counter()
+        nsi.nsi_check(contents)
+        seconds += time.perf_counter() - start
+        items += 1
+        size += len(json.dumps(contents["features"][0]["properties"]).encode())
+    return seconds, items, size
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Answer Atlus batch requests with a fixed parse of each item."""
+
+    def do_POST(self):
+        items = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        body = json.dumps(
+            {
+                "data": [
+                    {"@id": item["@id"], "@removed": [], "addr:street": item["address"]}
+                    for item in items
+                ]
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server() -> ThreadingHTTPServer:
+    """Serve a local stand-in for the Atlus API on a free port."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_atlus_request(
+    corpus: list[tuple[str, str]], api_url: str
+) -> tuple[float, int, int]:
+    """Time `atlus_request` against the stub server, without a cache."""
+    content = [
+        {
+            "id": f"{path}:{i}",
+            "properties": {
+                "addr:full": f"{props.get('addr:housenumber', '')} {props['addr:street']}"
+            },
+        }
+        for path, text in corpus
+        for i, feature in enumerate(json.loads(text).get("features", []))
+        if "addr:street" in (props := feature["properties"])
+    ]
+    size = sum(len(obj["properties"]["addr:full"].encode()) for obj in content)
+    client = AtlusClient(api_url=api_url, rate=1000, concurrency=8, chunk_size=2000)
+    start = time.perf_counter()
+    atlus_request(content, "address", client)
+    return time.perf_counter() - start, len(content), size
+
+
+def bench_process_directory(data_dir: str) -> tuple[float, int, int]:
+    """Time end-to-end directory cleaning of every data/ subdirectory."""
+    clean.normalize_cache.clear()
+    items = size = 0
+    seconds = 0.0
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in sorted(os.listdir(data_dir)):
+            input_dir = os.path.join(data_dir, name)
+            if not os.path.isdir(input_dir):
+                continue
+            output_dir = os.path.join(tmp, name)
+            start = time.perf_counter()
+            clean.process_directory(input_dir, output_dir, force=True)
+            seconds += time.perf_counter() - start
+            for file in os.listdir(output_dir):
+                if file.endswith(".geojson"):
+                    with open(os.path.join(output_dir, file), "r") as f:
+                        items += len(json.load(f)["features"])
+                    size += os.path.getsize(os.path.join(input_dir, file))
+            shutil.rmtree(output_dir)
+    return seconds, items, size
+
+
+def run_benchmarks(
+    data_dir: str = DATA_DIR, repeat: int = 3, only: list[str] | None = None
+) -> dict:
+    """Run every benchmark and return machine-readable results."""
+    corpus = load_corpus(data_dir)
+    strings = corpus_strings(corpus)
+    has_nsi = os.path.exists(nsi.NSI_PATH) or os.path.exists(nsi.INDEX_PATH)
+    server = start_stub_server()
+    api_url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    benchmarks: dict[str, tuple[Callable[[], tuple[float, int, int]], str, bool]] = {
+        "clean.run": (lambda: bench_run(corpus), "features", True),
+        "clean.abbrs": (lambda: bench_strings(strings, clean.abbrs), "strings", False),
+        "clean.get_title": (
+            lambda: bench_strings(strings, clean.get_title),
+            "strings",
+            False,
+        ),
+        "nsi.nsi_check": (lambda: bench_nsi_check(corpus), "files", True),
+        "atlusfile.atlus_request": (
+            lambda: bench_atlus_request(corpus, api_url),
+            "features",
+            False,
+        ),
+        "clean.process_directory": (
+            lambda: bench_process_directory(data_dir),
+            "features",
+            True,
+        ),
+    }
+
+    results = {}
+    # keep the per-feature prints of the cleaning rules out of the report
+    with open(os.devnull, "w") as devnull:
+        for name, (func, unit, needs_nsi) in benchmarks.items():
+            if only and name not in only:
+                continue
+            if needs_nsi and not has_nsi:
+                print(f"Skipping {name}: no NSI data at {nsi.NSI_PATH}")
+                continue
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                measured = best_of(repeat, func)
+            finally:
+                sys.stdout = stdout
+            results[name] = result(*measured, unit)
+            print(format_result(name, results[name]))
+    server.shutdown()
+
+    return {"meta": run_metadata(repeat), "results": results}
+
+
+def run_metadata(repeat: int) -> dict[str, str | int]:
+    """Describe the environment a baseline was recorded in."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count() or 1,
+        "repeat": repeat,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def format_result(name: str, res: dict) -> str:
+    """Format one benchmark result for the console."""
+    return (
+        f"{name:<26}{res['items_per_sec']:>14,.0f} {res['unit'] + '/s':<12}"
+        f"{res['mb_per_sec']:>9.2f} MB/s{res['seconds']:>10.3f} s"
+    )
+
+
+def compare(baseline: dict, current: dict, threshold: float = 10.0) -> list[str]:
+    """Print throughput changes and return benchmarks slower than `threshold` %."""
+    regressions = []
+    print(f"{'benchmark':<26}{'baseline':>14}{'current':>14}{'change':>10}")
+    for name, res in current["results"].items():
+        base = baseline["results"].get(name)
+        if not base or not base["items_per_sec"]:
+            print(f"{name:<26}{'-':>14}{res['items_per_sec']:>14,.0f}{'new':>10}")
+            continue
+        change = 100 * (res["items_per_sec"] / base["items_per_sec"] - 1)
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:<26}{base['items_per_sec']:>14,.0f}{res['items_per_sec']:>14,.0f}"
+            f"{change:>+9.1f}%{flag}"
+        )
+    return regressions
+
+
+def main():
+    """
+    Main CLI entry point for benchmarks.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the ATP pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("-d", "--data", default=DATA_DIR, help="Corpus directory")
+    run_parser.add_argument("-o", "--output", help="Save results to this JSON file")
+    run_parser.add_argument(
+        "-r", "--repeat", type=int, default=3, help="Runs per benchmark (default: 3)"
+    )
+    run_parser.add_argument(
+        "--only", type=lambda value: value.split(","), help="Benchmarks to run"
+    )
+    run_parser.add_argument("--baseline", help="Compare against this results file")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline", help="Earlier results file")
+    compare_parser.add_argument("current", help="Later results file")
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument(
+            "--threshold",
+            type=float,
+            default=10.0,
+            help="Slowdown in percent that counts as a regression (default: 10)",
+        )
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        current = run_benchmarks(args.data, args.repeat, args.only)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(current, f, indent=2)
+            print(f"Results saved to: {args.output}")
+        if not args.baseline:
+            return
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    else:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.current, "r", encoding="utf-8") as f:
+            current = json.load(f)
+
+    print()
+    if compare(baseline, current, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,20 +8,36 @@ python scripts/clean.py -f output/ihop.geojson -o output/ihop_clean.geojson
 """
 
 import os
-import json
+import sys
+import contextlib
+import cProfile
 import datetime
+import io
+import time
+from collections import Counter, deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from itertools import batched
 import regex
 from resources import (
-    street_expand,
-    direction_expand,
-    name_expand,
     useless_tags,
     repeat_tags,
     necessary_tags,
-    saints,
     us_state_codes,
 )
-from cli_utils import create_geojson_parser, process_input_output_paths
+from abbrev import expand
+from cli_utils import (
+    create_geojson_parser,
+    is_geojson,
+    output_name,
+    process_input_output_paths,
+)
+from jsonstream import FeatureCollectionWriter, read_collection, read_member
+from manifest import MANIFEST_NAME, Manifest, file_digest
+from metrics import RunMetrics, add_metrics_arguments
+from normcache import NormalizationCache
+from profiling import Profiler, format_profile
+from serialize import dump, load, open_text
 
 
 # from atlus import get_address
@@ -30,6 +46,12 @@ from nsi import (
 )
 
 VERSION = "0.3.0"
+# features per batch handed to a worker when cleaning a file in shards
+SHARD_SIZE = 1000
+
+# shared by every file cleaned in this process
+normalize_cache = NormalizationCache(version=VERSION)
+profiler = Profiler()
 
 
 def get_title(value: str, override_space: bool = False) -> str:
@@ -43,11 +65,8 @@ def lower_match(match: regex.Match) -> str:
     return match.group(1).lower()
 
 
-def all_the_same(tags: list[dict], key: str) -> bool:
-    """Check if all values of a key are the same."""
-    if any(key in tag for tag in tags):
-        return all(item[key] == tags[0][key] for item in tags[1:])
-    return False
+mc_comp = regex.compile(r"(.*\bMc)([a-z])(.*)")
+ord_comp = regex.compile(r"(\b[0-9]+[SNRT][tTdDhH]\b)")
 
 
 def us_replace(value: str) -> str:
@@ -57,7 +76,7 @@ def us_replace(value: str) -> str:
 
 def mc_replace(value: str) -> str:
     """Fix string containing improperly formatted Mc- prefix."""
-    mc_match = regex.search(r"(.*\bMc)([a-z])(.*)", value)
+    mc_match = mc_comp.search(value)
     if mc_match:
         return mc_match.group(1) + mc_match.group(2).title() + mc_match.group(3)
     return value
@@ -65,47 +84,7 @@ def mc_replace(value: str) -> str:
 
 def ord_replace(value: str) -> str:
     """Fix string containing improperly capitalized ordinal."""
-    return regex.sub(r"(\b[0-9]+[SNRT][tTdDhH]\b)", lower_match, value)
-
-
-def name_street_expand(match: regex.Match) -> str:
-    """Expand matched street type abbreviations."""
-    mat = match.group(1).upper().rstrip(".")
-    if mat:
-        return (name_expand | street_expand)[mat].title()
-    raise ValueError
-
-
-def direct_expand(match: regex.Match) -> str:
-    """Expand matched directional abbreviations."""
-    mat = match.group(1).upper().replace(".", "")
-    if mat:
-        return direction_expand[mat].title()
-    raise ValueError
-
-
-# pre-compile regex for speed
-abbr_join = "|".join(name_expand | street_expand)
-abbr_join_comp = regex.compile(
-    rf"(\b(?:{abbr_join})\b\.?)(?!')",
-    flags=regex.IGNORECASE,
-)
-
-dir_fill = "|".join(r"\.?".join(list(abbr)) for abbr in direction_expand)
-dir_fill_comp = regex.compile(
-    rf"(?<!(?:^(?:Avenue) |[\.']))(\b(?:{dir_fill})\b\.?)(?!(?:\.?[a-zA-Z]| (?:Street|Avenue)))",
-    flags=regex.IGNORECASE,
-)
-
-sr_comp = regex.compile(
-    r"(\bS\.?R\b\.?)(?= [0-9]+)",
-    flags=regex.IGNORECASE,
-)
-
-saint_comp = regex.compile(
-    rf"^(St\.?)(?= )|(\bSt\.?)(?= (?:{'|'.join(saints)}))",
-    flags=regex.IGNORECASE,
-)
+    return ord_comp.sub(lower_match, value)
 
 
 def get_first(value: str, sep: str = ";") -> str:
@@ -118,28 +97,17 @@ def get_first(value: str, sep: str = ";") -> str:
 def abbrs(value: str) -> str:
     """Bundle most common abbreviation expansion functions."""
     value = ord_replace(us_replace(mc_replace(value))).replace("  ", " ")
+    return expand(value).strip().replace("  ", " ")
 
-    # change likely 'St' to 'Saint'
-    value = saint_comp.sub(
-        "Saint",
-        value,
-    )
 
-    # expand common street and word abbreviations
-    value = abbr_join_comp.sub(
-        name_street_expand,
-        value,
-    )
+def normalize_name(value: str) -> str:
+    """Apply the full title-case and abbreviation chain to a name."""
+    return get_first(abbrs(get_title(value)))
 
-    # expand directionals
-    value = dir_fill_comp.sub(
-        direct_expand,
-        value,
-    )
 
-    # expand 'SR' if no other street types
-    value = sr_comp.sub("State Route", value)
-    return value.strip().replace("  ", " ")
+def normalize_city(value: str) -> str:
+    """Normalize a city name, title-casing single-word ALL-CAPS values too."""
+    return get_title(normalize_name(value), override_space=True)
 
 
 def print_value(action: str, file: str, brand: str, items: int) -> None:
@@ -149,211 +117,793 @@ def print_value(action: str, file: str, brand: str, items: int) -> None:
     )
 
 
-def run(contents: dict) -> dict:
-    """Run the cleaning program on selected files."""
+# tag-cleaning rules by name, applied to each feature in registration order
+RULES: dict[str, Callable[[dict[str, str], list[str]], None]] = {}
+
+
+def cleaning_rule(name: str) -> Callable:
+    """Register a tag-cleaning rule under a name usable from the CLI."""
 
-    # Filter features first
-    contents["features"] = [
-        obj
-        for obj in contents["features"]
-        if (
-            # Ensure addr:state is present and is a valid US state code
-            obj["properties"]["addr:state"] in us_state_codes
+    def register(func: Callable) -> Callable:
+        RULES[name] = func
+        return func
+
+    return register
+
+
+def select_rules(
+    include: list[str] | None = None, exclude: list[str] | None = None
+) -> list[str]:
+    """Return the names of the selected rules in the order they run."""
+    unknown = set(include or []) | set(exclude or [])
+    unknown -= set(RULES)
+    if unknown:
+        raise ValueError(f"Unknown cleaning rules: {', '.join(sorted(unknown))}")
+    return [
+        name
+        for name in RULES
+        if (include is None or name in include) and name not in (exclude or [])
+    ]
+
+
+phone_comp = regex.compile(
+    r"^\(?(?:\+? ?1?[ -.]*)?(?:\(?([0-9]{3})\)?[ -.]*)([0-9]{3})[ -.]*([0-9]{4})$"
+)
+phone_perf_comp = regex.compile(r"^\+1 [0-9]{3}-[0-9]{3}-[0-9]{4}$")
+tracking_comp = regex.compile(r"(https?:\/\/[^\s?#]+)(\?)[^#\s]*(utm|cid)[^#\s]*")
+unit_comp = regex.compile(
+    r"([0-9-]+[0-9])[ \-\/]?(?!st|nd|th|rd|ST|ND|TH|RD)([a-zA-Z]+)"
+)
+postcode_comp = regex.compile(r"([0-9]{5})-?0{4}")
+ref_url_comp = regex.compile(
+    r"https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*)"
+)
+hours_same_comp = regex.compile(r"(\d{2}):\d{2}-\1:\d{2}")
+hours_repeat_comp = regex.compile(r"([MTWFS][ouehra]).*; ?\1")
+
+
+@cleaning_rule("top_level_tags")
+def check_top_level_tags(objt: dict[str, str], wipe_repeat_tags: list[str]) -> None:
+    """Require at least one primary tag on the object."""
+    if (necessary_tags - set(objt)) == necessary_tags:
+        raise ValueError(f"No top-level tags on object:\n\t{objt}")
+
+
+@cleaning_rule("useless_tags")
+def remove_useless_tags(objt: dict[str, str], wipe_repeat_tags: list[str]) -> None:
+    """Remove useless ATP-generated tags and values repeated on every feature."""
+    for tag in useless_tags + wipe_repeat_tags:
+        objt.pop(tag, None)
+
+
+@cleaning_rule("names")
+def fix_names(objt: dict[str, str], wipe_repeat_tags: list[str]) -> None:
+    """Fix casing and expand abbreviations in names, branches and cities."""
+    for name_tag in ["name", "branch"]:
+        if name_tag in objt:
+            objt[name_tag] = normalize_cache.get("name", objt[name_tag], normalize_name)
+
+    if "addr:city" in objt:
+        objt["addr:city"] = normalize_cache.get(
+            "city", objt["addr:city"], normalize_city
         )
+
+
+@cleaning_rule("phone")
+def fix_phones(objt: dict[str, str], wipe_repeat_tags: list[str]) -> None:
+    """Keep the first phone number and format US and Canada numbers."""
+    for phone_tag in ["phone", "contact:phone", "fax"]:
+        if phone_tag in objt:
+            # split up multiple phone numbers
+            objt.update(
+                {phone_tag: get_first(objt[phone_tag])}
+                if ";" in objt[phone_tag]
+                else {}
+            )
+
+            # format US and Canada phone numbers
+            phone_valid = phone_comp.search(objt[phone_tag])
+            phone_perf = phone_perf_comp.search(objt[phone_tag])
+            objt.update(
+                {
+                    phone_tag: f"+1 {phone_valid.group(1)}-{phone_valid.group(2)}-{phone_valid.group(3)}"
+                }
+                if phone_valid and not phone_perf
+                else {}
+            )
+
+
+@cleaning_rule("website")
+def fix_websites(objt: dict[str, str], wipe_repeat_tags: list[str]) -> None:
+    """Require HTTPS and remove url tracking parameters."""
+    for web_tag in ["url", "website", "contact:website"]:
+        if web_tag in objt:
+            # check that website uses https
+            if not objt[web_tag].startswith("https:"):
+                raise ValueError("Website does not use HTTPS")
+
+            # remove url tracking parameters
+            objt[web_tag] = (
+                tracking_comp.sub(r"\1", objt[web_tag]).lower().replace(" ", "%20")
+            )
+
+
+@cleaning_rule("housenumber_unit")
+def split_unit(objt: dict[str, str], wipe_repeat_tags: list[str]) -> None:
+    """Pull out unit numbers from housenumber."""
+    if "addr:housenumber" in objt:
+        unit = unit_comp.match(objt["addr:housenumber"])
+        if unit:
+            objt["addr:housenumber"] = unit.group(1)
+            if "addr:unit" not in objt:
+                objt["addr:unit"] = unit.group(2).upper()
+
+
+@cleaning_rule("postcode")
+def fix_postcode(objt: dict[str, str], wipe_repeat_tags: list[str]) -> None:
+    """Remove extraneous postcode digits."""
+    if "addr:postcode" in objt:
+        objt["addr:postcode"] = postcode_comp.sub(r"\1", objt["addr:postcode"])
+
+
+@cleaning_rule("ref_url")
+def remove_url_refs(objt: dict[str, str], wipe_repeat_tags: list[str]) -> None:
+    """Remove refs that are just websites."""
+    for ref in [i for i in objt if i.startswith("ref")]:
+        if ref_url_comp.match(objt[ref]):
+            objt.pop(ref, None)
+
+
+@cleaning_rule("opening_hours")
+def fix_opening_hours(objt: dict[str, str], wipe_repeat_tags: list[str]) -> None:
+    """Simplify opening hours and flag nonsensical values."""
+    for open_hour in [i for i in objt if i.startswith("opening_hours")]:
+        if objt[open_hour].removeprefix("Mo-Su ") in [
+            "0:00-24:00",
+            "00:00-24:00",
+            "0-24",
+        ]:
+            print(f"Opening hours [{objt[open_hour]}] are always on")
+            objt[open_hour] = "24/7"
+
+            continue
+        open_match = hours_same_comp.search(objt[open_hour])
+        repeat_match = hours_repeat_comp.search(objt[open_hour])
+        if open_match or repeat_match:
+            # raise ValueError(
+            #     f"Opening hours [{objt['opening_hours']}] are nonsensical [file: {file}]"
+            # )
+            print(f"Opening hours [{objt['opening_hours']}] are nonsensical")
+
+        if "," in objt[open_hour]:
+            op = objt[open_hour].split(";")
+            objt[open_hour] = ";".join([each.split(",")[0] for each in op])
+        objt[open_hour] = objt[open_hour].removeprefix("Mo-Su ")
+
+
+@cleaning_rule("duplicate_unit")
+def remove_duplicate_unit(objt: dict[str, str], wipe_repeat_tags: list[str]) -> None:
+    """Drop addr:unit when it only repeats the housenumber."""
+    if objt.get("addr:unit") and objt.get("addr:housenumber"):
+        if objt["addr:unit"] == objt["addr:housenumber"]:
+            objt.pop("addr:unit", None)
+
+
+def rule_functions(rules: list[str] | None = None) -> list[Callable]:
+    """Look up the selected rules, timing each one when profiling."""
+    return [
+        profiler.timed(f"rules:{name}", RULES[name])
+        for name in (RULES if rules is None else rules)
     ]
 
-    features = contents["features"]
+
+def in_us(obj: dict) -> bool:
+    """Check that a feature has a valid US state code in addr:state."""
+    return obj["properties"]["addr:state"] in us_state_codes
+
+
+class SkipFileError(ValueError):
+    """Declare a file that is already cleaned or imported."""
+
+    def __init__(self, message="Skipping"):
+        self.message = message
+        super().__init__(self.message)
+
+
+def is_cleaned(attributes: dict | None) -> bool:
+    """Check if dataset attributes mark a file as cleaned by this version or imported."""
+    try:
+        return (
+            attributes["cleaning"]["version"] == VERSION
+            or attributes["cleaning"]["status"] == "imported"
+        )
+    except (KeyError, TypeError):
+        return False
+
+
+def clean_attributes(attributes: dict | None) -> dict:
+    """Stamp dataset attributes with this cleaning run, skipping cleaned files."""
     clean_data = {
         "version": VERSION,
         "datetime": str(datetime.datetime.now().date()),
     }
-    if "dataset_attributes" in contents:
-        try:
-            if (
-                contents["dataset_attributes"]["cleaning"]["version"] == VERSION
-                or contents["dataset_attributes"]["cleaning"]["status"] == "imported"
-            ):
-                raise ValueError("Skipping")
-        except KeyError:
-            pass
-
-        contents["dataset_attributes"]["cleaning"] = clean_data
-    else:
-        contents["dataset_attributes"] = {"cleaning": clean_data}
-
-    wipe_repeat_tags: list[str] = []
-    for repeat_tag in repeat_tags:
-        if all_the_same(features, repeat_tag) and any(
-            feature.get(repeat_tag) for feature in features
-        ):
-            wipe_repeat_tags.append(repeat_tag)
-
-    nsi_check(contents)
-
-    for obj in contents["features"]:
-        objt: dict[str, str] = obj["properties"]
-
-        # for address_tag in ["addr:street_address", "addr:full"]:
-        #     if address_tag in objt:
-        #         addr_dict = get_address(str(objt[address_tag]))[0]
-        #         objt = {**objt, **addr_dict}
-        #     objt.pop(address_tag, None)
-
-        if (necessary_tags - set(objt)) == necessary_tags:
-            raise ValueError(f"No top-level tags on object:\n\t{objt}")
-
-        # remove useless ATP-generated tags
-        for tag in useless_tags + wipe_repeat_tags:
-            objt.pop(tag, None)
-
-        for name_tag in ["name", "branch", "addr:city"]:
-            if name_tag in objt:
-                objt[name_tag] = get_first(abbrs(get_title(objt[name_tag])))
-
-        if "addr:city" in objt:
-            objt["addr:city"] = get_title(objt["addr:city"], override_space=True)
-
-        for phone_tag in ["phone", "contact:phone", "fax"]:
-            if phone_tag in objt:
-                # split up multiple phone numbers
-                objt.update(
-                    {phone_tag: get_first(objt[phone_tag])}
-                    if ";" in objt[phone_tag]
-                    else {}
-                )
+    if attributes is None:
+        return {"cleaning": clean_data}
 
-                # format US and Canada phone numbers
-                phone_valid = regex.search(
-                    r"^\(?(?:\+? ?1?[ -.]*)?(?:\(?([0-9]{3})\)?[ -.]*)([0-9]{3})[ -.]*([0-9]{4})$",
-                    objt[phone_tag],
-                )
-                phone_perf = regex.search(
-                    r"^\+1 [0-9]{3}-[0-9]{3}-[0-9]{4}$", objt[phone_tag]
-                )
-                objt.update(
-                    {
-                        phone_tag: f"+1 {phone_valid.group(1)}-{phone_valid.group(2)}-{phone_valid.group(3)}"
-                    }
-                    if phone_valid and not phone_perf
-                    else {}
-                )
+    if is_cleaned(attributes):
+        raise SkipFileError()
+
+    attributes["cleaning"] = clean_data
+    return attributes
+
+
+class RepeatTagCounter:
+    """Track which repeat tags hold one shared value across all features."""
+
+    def __init__(self):
+        self.first: dict[str, object] = {}
+        self.same = dict.fromkeys(repeat_tags, True)
+        self.truthy = dict.fromkeys(repeat_tags, False)
+
+    def add(self, feature: dict) -> None:
+        """Fold one feature into the statistics."""
+        for tag in repeat_tags:
+            if not self.same[tag]:
+                continue
+            if tag not in feature:
+                self.same[tag] = False
+                continue
+            value = self.first.setdefault(tag, feature[tag])
+            self.same[tag] = value == feature[tag]
+            self.truthy[tag] = self.truthy[tag] or bool(feature[tag])
+
+    def wipe_tags(self) -> list[str]:
+        """Return the repeat tags that are identical and set on every feature."""
+        return [tag for tag in repeat_tags if self.same[tag] and self.truthy[tag]]
+
+
+class Stage:
+    """
+    One step of a cleaning run.
+
+    Global stages see every kept feature during the statistics pass and
+    publish what they learn into a shared context; feature stages then
+    transform each feature in the single cleaning pass.
+    """
+
+    name = ""
+    scope = "feature"
+
+    def __init__(self, rules: list[str] | None = None):
+        pass
+
+    def observe(self, obj: dict) -> None:
+        """Fold a kept feature into the statistics of a global stage."""
 
-        for web_tag in ["url", "website", "contact:website"]:
-            if web_tag in objt:
-                # check that website uses https
-                if not objt[web_tag].startswith("https:"):
-                    raise ValueError("Website does not use HTTPS")
-
-                # remove url tracking parameters
-                objt[web_tag] = (
-                    regex.sub(
-                        r"(https?:\/\/[^\s?#]+)(\?)[^#\s]*(utm|cid)[^#\s]*",
-                        r"\1",
-                        objt[web_tag],
-                    )
-                    .lower()
-                    .replace(" ", "%20")
+    def finish(self, context: dict) -> None:
+        """Publish the statistics once every feature has been observed."""
+
+    def apply(self, obj: dict, context: dict) -> None:
+        """Transform one feature in place."""
+
+
+STAGES: list[type[Stage]] = []
+
+
+def pipeline_stage(cls: type[Stage]) -> type[Stage]:
+    """Register a stage; stages run in registration order within their scope."""
+    STAGES.append(cls)
+    return cls
+
+
+@pipeline_stage
+class RepeatTagStage(Stage):
+    """Find the repeat tags to wipe from every feature."""
+
+    name = "repeat_tags"
+    scope = "global"
+
+    def __init__(self, rules: list[str] | None = None):
+        self.counter = RepeatTagCounter()
+
+    def observe(self, obj: dict) -> None:
+        self.counter.add(obj)
+
+    def finish(self, context: dict) -> None:
+        context["wipe_repeat_tags"] = self.counter.wipe_tags()
+
+
+@pipeline_stage
+class NsiStage(Stage):
+    """Check the file's brand against NSI; only the first feature matters."""
+
+    name = "nsi_check"
+    scope = "global"
+
+    def __init__(self, rules: list[str] | None = None):
+        self.first: list[dict] = []
+
+    def observe(self, obj: dict) -> None:
+        if not self.first:
+            self.first.append(obj)
+
+    def finish(self, context: dict) -> None:
+        nsi_check({"features": self.first})
+
+
+@pipeline_stage
+class RulesStage(Stage):
+    """Apply the selected cleaning rules."""
+
+    name = "rules"
+
+    def __init__(self, rules: list[str] | None = None):
+        self.funcs = rule_functions(rules)
+
+    def apply(self, obj: dict, context: dict) -> None:
+        clean_feature(obj, context["wipe_repeat_tags"], self.funcs)
+
+
+class Pipeline:
+    """Run every registered stage in one statistics pass and one cleaning pass."""
+
+    def __init__(self, rules: list[str] | None = None):
+        self.rules = rules
+        stages = [cls(rules) for cls in STAGES]
+        self.global_stages = [s for s in stages if s.scope == "global"]
+        self.feature_stages = [s for s in stages if s.scope == "feature"]
+        self.context: dict = {}
+        # every counter is reported, even when it stays at zero
+        self.counts: Counter[str] = Counter(
+            features_in=0, features_dropped=0, tags_removed=0
+        )
+
+    def observe(self, obj: dict) -> bool:
+        """Feed a feature to the global stages if it is kept; return whether it is."""
+        self.counts["features_in"] += 1
+        if not in_us(obj):
+            self.counts["features_dropped"] += 1
+            return False
+        for stage in self.global_stages:
+            stage.observe(obj)
+        return True
+
+    def finish(self) -> dict:
+        """Close the statistics pass and return the shared context."""
+        for stage in self.global_stages:
+            with profiler.stage(stage.name):
+                stage.finish(self.context)
+        return self.context
+
+    def apply(self, obj: dict) -> dict:
+        """Run the feature stages on one kept feature."""
+        keys = list(obj["properties"])
+        for stage in self.feature_stages:
+            with profiler.stage(stage.name):
+                stage.apply(obj, self.context)
+        props = obj["properties"]
+        self.counts["tags_removed"] += sum(key not in props for key in keys)
+        return obj
+
+    def apply_all(self, features: Iterable[dict], shards: int = 1) -> Iterator[dict]:
+        """
+        Run the feature stages on every kept feature, yielding them in order.
+
+        With more than one shard, batches of features are cleaned in worker
+        processes, with a bounded number in flight.
+        """
+        if shards <= 1:
+            for obj in features:
+                yield self.apply(obj)
+            return
+        executor = _shard_executor(shards)
+        pending: deque[Future] = deque()
+        for batch in batched(features, SHARD_SIZE):
+            pending.append(
+                executor.submit(
+                    _run_captured, _clean_shard, batch, self.context, self.rules
                 )
-        if "addr:housenumber" in objt:
-            # pull out unit numbers from housenumber
-            unit = regex.match(
-                r"([0-9-]+[0-9])[ \-\/]?(?!st|nd|th|rd|ST|ND|TH|RD)([a-zA-Z]+)",
-                objt["addr:housenumber"],
-            )
-            if unit:
-                objt["addr:housenumber"] = unit.group(1)
-                if "addr:unit" not in objt:
-                    objt["addr:unit"] = unit.group(2).upper()
-
-        if "addr:postcode" in objt:
-            # remove extraneous postcode digits
-            objt["addr:postcode"] = regex.sub(
-                r"([0-9]{5})-?0{4}", r"\1", objt["addr:postcode"]
             )
+            if len(pending) >= shards * 2:
+                yield from _shard_result(pending.popleft(), self.counts)
+        while pending:
+            yield from _shard_result(pending.popleft(), self.counts)
 
-        for ref in [i for i in objt if i.startswith("ref")]:
-            # remove refs that are just websites
-            if regex.match(
-                r"https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*)",
-                objt[ref],
-            ):
-                objt.pop(ref, None)
-
-        for open_hour in [i for i in objt if i.startswith("opening_hours")]:
-            if objt[open_hour].removeprefix("Mo-Su ") in [
-                "0:00-24:00",
-                "00:00-24:00",
-                "0-24",
-            ]:
-                print(f"Opening hours [{objt[open_hour]}] are always on")
-                objt[open_hour] = "24/7"
 
-                continue
-            open_match = regex.search(r"(\d{2}):\d{2}-\1:\d{2}", objt[open_hour])
-            repeat_match = regex.search(r"([MTWFS][ouehra]).*; ?\1", objt[open_hour])
-            if open_match or repeat_match:
-                # raise ValueError(
-                #     f"Opening hours [{objt['opening_hours']}] are nonsensical [file: {file}]"
-                # )
-                print(f"Opening hours [{objt['opening_hours']}] are nonsensical")
+_shard_pool: tuple[int, ProcessPoolExecutor] | None = None
 
-            if "," in objt[open_hour]:
-                op = objt[open_hour].split(";")
-                objt[open_hour] = ";".join([each.split(",")[0] for each in op])
-            objt[open_hour] = objt[open_hour].removeprefix("Mo-Su ")
 
-        if objt.get("addr:unit") and objt.get("addr:housenumber"):
-            if objt["addr:unit"] == objt["addr:housenumber"]:
-                objt.pop("addr:unit", None)
+def _shard_executor(shards: int) -> ProcessPoolExecutor:
+    """Return the worker pool for sharded cleaning, reused between files."""
+    global _shard_pool
+    if _shard_pool is None or _shard_pool[0] != shards:
+        if _shard_pool is not None:
+            _shard_pool[1].shutdown()
+        executor = ProcessPoolExecutor(
+            max_workers=shards,
+            initializer=_init_worker,
+            initargs=(normalize_cache.entries(), profiler.enabled, None),
+        )
+        _shard_pool = (shards, executor)
+    return _shard_pool[1]
+
+
+def _clean_shard(
+    features: tuple[dict, ...], context: dict, rules: list[str] | None
+) -> tuple:
+    """Clean a batch of features and hand back its cache work and profile."""
+    pipeline = Pipeline(rules)
+    pipeline.context = context
+    cleaned = [pipeline.apply(obj) for obj in features]
+    return cleaned, pipeline.counts, normalize_cache.drain(), profiler.drain()
+
+
+def _shard_result(future: Future, counts: Counter[str]) -> list[dict]:
+    """Merge a finished shard's counts, cache work and profile, returning its features."""
+    cleaned, shard_counts, cache_work, profile = _worker_result(future)
+    counts.update(shard_counts)
+    normalize_cache.merge(cache_work)
+    for name, (seconds, calls) in profile.items():
+        profiler.record(name, seconds, calls)
+    return cleaned
+
+
+def run(
+    contents: dict,
+    rules: list[str] | None = None,
+    shards: int = 1,
+    counts: Counter[str] | None = None,
+) -> dict:
+    """Run the cleaning program on selected files, adding what it did to `counts`."""
+    contents["dataset_attributes"] = clean_attributes(
+        contents.get("dataset_attributes")
+    )
+    pipeline = Pipeline(rules)
+
+    # one pass drops features outside the US and gathers file-wide statistics
+    with profiler.stage("statistics"):
+        contents["features"] = [
+            obj for obj in contents["features"] if pipeline.observe(obj)
+        ]
+    pipeline.finish()
 
-        obj["properties"] = objt
+    contents["features"] = list(pipeline.apply_all(contents["features"], shards))
+    if counts is not None:
+        counts.update(pipeline.counts)
 
     return contents
 
 
-def process_file(input_path: str, output_path: str) -> None:
+def clean_feature(
+    obj: dict, wipe_repeat_tags: list[str], rules: list[Callable] | None = None
+) -> dict:
+    """Clean the tags of a single feature in place."""
+    objt: dict[str, str] = obj["properties"]
+
+    # for address_tag in ["addr:street_address", "addr:full"]:
+    #     if address_tag in objt:
+    #         addr_dict = get_address(str(objt[address_tag]))[0]
+    #         objt = {**objt, **addr_dict}
+    #     objt.pop(address_tag, None)
+
+    for rule in RULES.values() if rules is None else rules:
+        rule(objt, wipe_repeat_tags)
+
+    obj["properties"] = objt
+
+    return obj
+
+
+def process_file(
+    input_path: str,
+    output_path: str,
+    stream: bool = False,
+    rules: list[str] | None = None,
+    fmt: str = "indent",
+    shards: int = 1,
+) -> dict[str, int]:
     """
     Process a single GeoJSON file.
 
     :param input_path: Path to input GeoJSON file
     :param output_path: Path to output processed GeoJSON file
+    :param stream: Clean feature by feature instead of loading the whole file
+    :param rules: Names of the cleaning rules to apply (default: all)
+    :param fmt: Output layout, one of `serialize.FORMATS`
+    :param shards: Number of worker processes cleaning the file's features
+    :return: Features in, out and dropped outside the US, and tags removed
     """
+    # Check the dataset attributes before paying for a full parse
+    with profiler.stage("skip_check"):
+        if is_cleaned(read_member(input_path, "dataset_attributes")):
+            raise SkipFileError()
+
     # Ensure output directory exists
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-    # Read input file
-    with open(input_path, "r") as f:
-        content = json.load(f)
+    if stream:
+        counts = process_file_streaming(input_path, output_path, rules, fmt, shards)
+    else:
+        # Read input file
+        with profiler.stage("parse"):
+            content = load(input_path)
+
+        # Process content
+        counts = Counter()
+        processed_content = run(content, rules, shards, counts)
+
+        # Write processed content
+        with profiler.stage("write"):
+            dump(processed_content, output_path, fmt)
 
-    # Process content
-    processed_content = run(content)
+    counts["features_out"] = counts["features_in"] - counts["features_dropped"]
+    return dict(counts)
 
-    # Write processed content
-    with open(output_path, "w") as f:
-        json.dump(processed_content, f, indent=2)
 
+def process_file_streaming(
+    input_path: str,
+    output_path: str,
+    rules: list[str] | None = None,
+    fmt: str = "indent",
+    shards: int = 1,
+) -> Counter[str]:
+    """
+    Clean a GeoJSON file in two passes with bounded memory.
+
+    The first pass gathers the top-level members and the statistics the
+    file-wide checks need; the second cleans and writes one feature at a time.
 
-def process_directory(input_dir: str, output_dir: str) -> None:
+    :param input_path: Path to input GeoJSON file
+    :param output_path: Path to output processed GeoJSON file
+    :param rules: Names of the cleaning rules to apply (default: all)
+    :param fmt: Output layout, one of `serialize.FORMATS`
+    :param shards: Number of worker processes cleaning the file's features
+    :return: Features in and dropped outside the US, and tags removed
+    """
+    header: dict = {}
+    trailer: dict = {}
+    pipeline = Pipeline(rules)
+
+    with profiler.stage("first_pass"), open_text(input_path) as f:
+        members = header
+        for key, value in read_collection(f):
+            if key != "features":
+                members[key] = value
+                continue
+            for obj in value:
+                pipeline.observe(obj)
+            members = trailer
+
+    if "dataset_attributes" in header:
+        header["dataset_attributes"] = clean_attributes(header["dataset_attributes"])
+    else:
+        trailer["dataset_attributes"] = clean_attributes(
+            trailer.get("dataset_attributes")
+        )
+    pipeline.finish()
+
+    # keep any .gz suffix so the temporary file is compressed like the output
+    base = output_path.removesuffix(".gz")
+    tmp_path = base + ".tmp" + output_path[len(base) :]
+    stages = [stage.name for stage in pipeline.feature_stages]
+    start = time.perf_counter()
+    before = sum(profiler.seconds(name) for name in stages)
+    try:
+        with open_text(input_path) as f, open_text(tmp_path, "w") as out:
+            writer = FeatureCollectionWriter(out, fmt)
+            writer.members(header)
+            for key, value in read_collection(f):
+                if key != "features":
+                    continue
+                writer.begin_features()
+                kept = (obj for obj in value if in_us(obj))
+                for obj in pipeline.apply_all(kept, shards):
+                    writer.feature(obj)
+                writer.end_features()
+            writer.members(trailer)
+            writer.close()
+        os.replace(tmp_path, output_path)
+        if profiler.enabled:
+            elapsed = time.perf_counter() - start
+            # stages run in this process only when the file is not sharded
+            if shards <= 1:
+                elapsed -= sum(profiler.seconds(name) for name in stages) - before
+            profiler.record("second_pass", elapsed)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return pipeline.counts
+
+
+def process_directory(
+    input_dir: str,
+    output_dir: str,
+    jobs: int = 1,
+    stream: bool = False,
+    rules: list[str] | None = None,
+    force: bool = False,
+    fmt: str = "indent",
+    gzip: bool = False,
+    shards: int = 1,
+    metrics: RunMetrics | None = None,
+) -> list[str]:
     """
     Process all GeoJSON files in a directory.
 
     :param input_dir: Directory containing input GeoJSON files
     :param output_dir: Directory to save processed GeoJSON files
+    :param jobs: Number of worker processes (0 for one per CPU)
+    :param stream: Clean feature by feature instead of loading whole files
+    :param rules: Names of the cleaning rules to apply (default: all)
+    :param force: Clean every file, even if the manifest shows it unchanged
+    :param fmt: Output layout, one of `serialize.FORMATS`
+    :param gzip: Compress the outputs, adding .gz to their names
+    :param shards: Number of worker processes cleaning each file's features,
+        used only when files are processed one at a time
+    :param metrics: Run metrics to record each file in
+    :return: Names of the files that failed to process
     """
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
 
-    # Process each GeoJSON file in the input directory
-    for filename in os.listdir(input_dir):
-        if filename.endswith(".geojson"):
-            input_path = os.path.join(input_dir, filename)
-            output_path = os.path.join(output_dir, filename)
+    filenames = sorted(
+        filename for filename in os.listdir(input_dir) if is_geojson(filename)
+    )
+    jobs = jobs or os.cpu_count() or 1
+
+    # Leave out inputs that are unchanged since the last run
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME))
+    outputs = {
+        filename: os.path.join(output_dir, output_name(filename, gzip))
+        for filename in filenames
+    }
+    entries = {}
+    pending = []
+    for filename in filenames:
+        entries[filename] = manifest.entry(
+            file_digest(os.path.join(input_dir, filename)),
+            VERSION,
+            outputs[filename],
+            list(RULES) if rules is None else rules,
+            fmt,
+        )
+        if not force and manifest.is_current(filename, entries[filename]):
+            print(f"Unchanged: {filename}")
+            if metrics:
+                metrics.file(filename, status="unchanged")
+        else:
+            pending.append(filename)
+
+    failed: list[str] = []
+    parallel = jobs > 1 and len(pending) > 1
+    # file workers cannot start shard pools of their own, so they clean serially
+    if parallel:
+        shards = 1
+    with (
+        ProcessPoolExecutor(
+            max_workers=min(jobs, len(pending)),
+            initializer=_init_worker,
+            initargs=(normalize_cache.entries(), profiler.enabled, profiler.output_dir),
+        )
+        if parallel
+        else _SerialExecutor()
+    ) as executor:
+        futures = (
+            executor.submit(
+                _run_captured,
+                _process_file_worker,
+                os.path.join(input_dir, filename),
+                outputs[filename],
+                stream,
+                rules,
+                fmt,
+                shards,
+            )
+            for filename in pending
+        )
+        # queue every file for the workers up front; run serially, each file
+        # is cleaned just before it is reported so its warnings stay with it
+        if parallel:
+            futures = list(futures)
 
+        # Report in submission order so output is stable across runs
+        for filename, future in zip(pending, futures):
             try:
-                process_file(input_path, output_path)
+                cache_work, profile, counts, seconds = _worker_result(future)
+                normalize_cache.merge(cache_work)
+                manifest.record(filename, entries[filename])
                 print(f"Processed: {filename}")
+                if profiler.enabled:
+                    print(format_profile(filename, profile))
+                if metrics:
+                    metrics.file(filename, counts, seconds)
+            except SkipFileError:
+                print(f"Skipped: {filename}")
+                if metrics:
+                    metrics.file(filename, status="skipped")
             except Exception as e:
                 print(f"Error processing {filename}: {e}")
+                failed.append(filename)
+                if metrics:
+                    metrics.file(filename, status="failed")
+
+    manifest.save()
+    if failed:
+        print(f"\n{len(failed)} of {len(filenames)} files failed: {', '.join(failed)}")
+    return failed
+
+
+def _init_worker(
+    cache_entries: list[tuple[str, str, str]],
+    profile: bool = False,
+    profile_dir: str | None = None,
+) -> None:
+    """Warm a worker's normalization cache and record what it adds."""
+    # forked workers start with the parent's counters, which it already has
+    normalize_cache.drain()
+    profiler.drain()
+    normalize_cache.update(cache_entries)
+    normalize_cache.track_new = True
+    profiler.enabled = profile
+    profiler.output_dir = profile_dir
+
+
+def _process_file_worker(input_path: str, output_path: str, *args) -> tuple:
+    """Process a file and hand its cache work, profile, counts and time back."""
+    profiler.drain()
+    start = time.perf_counter()
+    if profiler.output_dir:
+        os.makedirs(profiler.output_dir, exist_ok=True)
+        with cProfile.Profile() as prof:
+            counts = process_file(input_path, output_path, *args)
+        prof.dump_stats(
+            os.path.join(profiler.output_dir, os.path.basename(input_path) + ".pstats")
+        )
+    else:
+        counts = process_file(input_path, output_path, *args)
+    seconds = time.perf_counter() - start
+    return normalize_cache.drain(), profiler.drain(), counts, seconds
+
+
+def _run_captured(func: Callable, *args) -> tuple:
+    """Run a call in a worker, handing back what it printed with its result."""
+    out, err = io.StringIO(), io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            result = func(*args)
+    except Exception as e:
+        # a worker's own output is lost when the caller redirects it, as the
+        # server does, so it travels back with the outcome instead
+        e.output = (out.getvalue(), err.getvalue())
+        raise
+    return (out.getvalue(), err.getvalue()), result
+
+
+def _worker_result(future: Future):
+    """Print what a `_run_captured` call printed and return its result."""
+    out = err = ""
+    try:
+        (out, err), result = future.result()
+    except Exception as e:
+        out, err = getattr(e, "output", ("", ""))
+        raise
+    finally:
+        sys.stdout.write(out)
+        sys.stderr.write(err)
+    return result
+
+
+class _SerialExecutor(Executor):
+    """Run submitted calls in the current process, one at a time."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        """Run the call immediately and wrap its outcome in a future."""
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
 
 
 def main():
@@ -363,19 +913,115 @@ def main():
     # Create parser with a specific description
     parser = create_geojson_parser(description="Process GeoJSON files using Atlus API")
 
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of files to clean in parallel (default: 1, 0 for one per CPU)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Clean feature by feature to keep memory flat on large files",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Processes sharing the features of each file (default: 1, 0 for one per CPU)",
+    )
+    parser.add_argument(
+        "--rules",
+        type=lambda value: value.split(","),
+        help="Comma-separated cleaning rules to apply (default: all)",
+    )
+    parser.add_argument(
+        "--skip-rules",
+        type=lambda value: value.split(","),
+        help="Comma-separated cleaning rules to leave out",
+    )
+    parser.add_argument(
+        "--cache",
+        help="File to load and save normalized names from, to reuse across runs",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print wall time and call counts per stage and rule for each file",
+    )
+    parser.add_argument(
+        "--profile-output",
+        help="Directory to write one cProfile .pstats file per cleaned file",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Clean every file in a directory, even if unchanged since the last run",
+    )
+    add_metrics_arguments(parser)
+
     # Parse arguments
     args = parser.parse_args()
 
+    try:
+        rules = select_rules(args.rules, args.skip_rules)
+    except ValueError as e:
+        parser.error(f"{e} (available: {', '.join(RULES)})")
+
     # Process input and output paths
     input_path, output_path = process_input_output_paths(args)
 
+    if args.cache:
+        normalize_cache.load(args.cache)
+    profiler.enabled = args.profile
+    profiler.output_dir = args.profile_output
+    shards = args.shards or os.cpu_count() or 1
+    metrics = RunMetrics.from_args("clean", args)
+
     # Process single file or directory
-    if os.path.isfile(input_path):
-        process_file(input_path, output_path)
-        print(f"Processed file saved to: {output_path}")
-    else:
-        process_directory(input_path, output_path)
-        print(f"Processed files saved to: {output_path}")
+    failed = []
+    try:
+        if os.path.isfile(input_path):
+            name = os.path.basename(input_path)
+            try:
+                cache_work, profile, counts, seconds = _process_file_worker(
+                    input_path, output_path, args.stream, rules, args.format, shards
+                )
+                normalize_cache.merge(cache_work)
+                print(f"Processed file saved to: {output_path}")
+                if profiler.enabled:
+                    print(format_profile(name, profile))
+                metrics.file(name, counts, seconds)
+            except SkipFileError:
+                print(f"Skipped already cleaned file: {input_path}")
+                metrics.file(name, status="skipped")
+            except Exception:
+                metrics.file(name, status="failed")
+                raise
+        else:
+            failed = process_directory(
+                input_path,
+                output_path,
+                jobs=args.jobs,
+                stream=args.stream,
+                rules=rules,
+                force=args.force,
+                fmt=args.format,
+                gzip=args.gzip,
+                shards=shards,
+                metrics=metrics,
+            )
+            print(f"Processed files saved to: {output_path}")
+    finally:
+        # a failed run still leaves its record and textfile behind
+        metrics.finish()
+
+    print(normalize_cache.summary())
+    if args.cache:
+        normalize_cache.save(args.cache)
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
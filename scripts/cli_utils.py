@@ -6,6 +6,8 @@ import argparse
 import os
 import sys
 
+from serialize import FORMATS
+
 
 def create_geojson_parser(
     description: str = "Process GeoJSON files",
@@ -32,10 +34,49 @@ def create_geojson_parser(
         "--output",
         help='Output file or directory (default: same as input with "_processed" suffix)',
     )
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="indent",
+        help="Output layout: indent (default), prettier (as the committed data/), "
+        "or compact",
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Compress outputs, adding .gz to their names",
+    )
 
     return parser
 
 
+def is_geojson(filename: str, extension: str = ".geojson") -> bool:
+    """Check whether a file name is a GeoJSON file, plain or gzip-compressed."""
+    name = filename.lower()
+    return name.endswith(extension) or name.endswith(extension + ".gz")
+
+
+def output_name(filename: str, gzip: bool = False) -> str:
+    """Name an output after its input, compressed if requested."""
+    return filename + ".gz" if gzip and not filename.endswith(".gz") else filename
+
+
+def corpus_files(roots: list[str]) -> list[str]:
+    """List the GeoJSON files under the given files and directories."""
+    paths = []
+    for root in roots:
+        if os.path.isfile(root):
+            paths.append(os.path.abspath(root))
+            continue
+        for dirpath, _, files in sorted(os.walk(root)):
+            paths.extend(
+                os.path.abspath(os.path.join(dirpath, file))
+                for file in sorted(files)
+                if is_geojson(file) and not file.startswith("missing")
+            )
+    return paths
+
+
 def process_input_output_paths(
     args: argparse.Namespace, input_extension: str = ".geojson"
 ) -> tuple[str, str]:
@@ -52,7 +93,7 @@ def process_input_output_paths(
     # Validate and process file input
     if args.file:
         # Validate input file extension
-        if not args.file.lower().endswith(input_extension):
+        if not is_geojson(args.file, input_extension):
             print(f"Error: Input must be a {input_extension} file", file=sys.stderr)
             sys.exit(1)
 
@@ -62,8 +103,9 @@ def process_input_output_paths(
         if args.output:
             output_path = os.path.abspath(args.output)
         else:
-            base, ext = os.path.splitext(input_path)
-            output_path = f"{base}_processed{ext}"
+            base, ext = os.path.splitext(input_path.removesuffix(".gz"))
+            output_path = f"{base}_processed{ext}" + input_path[len(base + ext) :]
+        output_path = output_name(output_path, args.gzip)
 
     # Validate and process directory input
     elif args.directory:
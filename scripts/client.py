@@ -0,0 +1,166 @@
+"""
+Send cleaning requests to a running server.py instead of starting clean.py.
+
+Example usage:
+```
+python scripts/client.py -f output/ihop.geojson -o output/ihop_clean.geojson
+python scripts/client.py -d output --atlus address --url http://127.0.0.1:8765
+```
+
+Besides the standard library only the argument helpers of cli_utils (and
+through them serialize) are imported, not the cleaning modules, so a call
+costs little more than the cleaning itself. Paths are sent to the server,
+which reads and writes the files directly.
+"""
+
+import http.client
+import json
+import os
+import socket
+import sys
+from typing import Any
+from urllib.parse import urlsplit
+
+from cli_utils import create_geojson_parser, process_input_output_paths
+
+SOCKET_PATH = "build/clean.sock"
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix domain socket."""
+
+    def __init__(self, socket_path: str):
+        super().__init__("localhost")
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def post(
+    path: str,
+    payload: dict[str, Any],
+    socket_path: str = SOCKET_PATH,
+    url: str | None = None,
+) -> tuple[int, dict[str, Any]]:
+    """
+    Send one request to the server and wait for its answer.
+
+    :param path: Endpoint, such as /clean or /atlus
+    :param payload: Request parameters
+    :param socket_path: Unix socket the server listens on
+    :param url: Server base URL, used instead of the socket when given
+    :return: HTTP status and decoded response body
+    """
+    if url:
+        parts = urlsplit(url)
+        conn = http.client.HTTPConnection(parts.hostname, parts.port)
+    else:
+        conn = UnixHTTPConnection(socket_path)
+    try:
+        body = json.dumps(payload).encode("utf-8")
+        conn.request(
+            "POST", path, body=body, headers={"Content-Type": "application/json"}
+        )
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b"{}")
+    finally:
+        conn.close()
+
+
+def main():
+    """
+    Main CLI entry point for the cleaning client.
+    """
+    parser = create_geojson_parser(description="Clean GeoJSON files on a server")
+    parser.add_argument(
+        "--socket",
+        default=SOCKET_PATH,
+        help=f"Unix socket of the server (default: {SOCKET_PATH})",
+    )
+    parser.add_argument("--url", help="Server base URL, instead of the socket")
+    parser.add_argument(
+        "--atlus",
+        choices=["address", "phone"],
+        help="Run atlusfile.py on this field instead of clean.py",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Clean feature by feature to keep memory flat on large files",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of files to clean in parallel (default: 1, 0 for one per CPU)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Processes sharing the features of each file (default: 1, 0 for one per CPU)",
+    )
+    parser.add_argument(
+        "--rules",
+        type=lambda value: value.split(","),
+        help="Comma-separated cleaning rules to apply (default: all)",
+    )
+    parser.add_argument(
+        "--skip-rules",
+        type=lambda value: value.split(","),
+        help="Comma-separated cleaning rules to leave out",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Clean every file in a directory, even if unchanged since the last run",
+    )
+
+    args = parser.parse_args()
+
+    input_path, output_path = process_input_output_paths(args)
+    payload: dict[str, Any] = {
+        "input": input_path,
+        "output": output_path,
+        "format": args.format,
+        "gzip": args.gzip,
+    }
+    if args.atlus:
+        endpoint = "/atlus"
+        payload["field"] = args.atlus
+    else:
+        endpoint = "/clean"
+        payload |= {
+            "stream": args.stream,
+            "shards": args.shards,
+            "jobs": args.jobs,
+            "rules": args.rules,
+            "skip_rules": args.skip_rules,
+            "force": args.force,
+        }
+
+    try:
+        status, response = post(endpoint, payload, args.socket, args.url)
+    except OSError as e:
+        print(f"Cannot reach the cleaning server: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    sys.stdout.write(response.get("log", ""))
+    if status != 200:
+        print(f"Error: {response.get('error', status)}", file=sys.stderr)
+        sys.exit(1)
+    if response.get("skipped"):
+        print(f"Skipped already cleaned file: {input_path}")
+    elif os.path.isfile(input_path):
+        print(f"Processed file saved to: {output_path}")
+    else:
+        print(f"Processed files saved to: {output_path}")
+    if response.get("failed"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""
+Keep every cleaned spider in one SQLite database for fast ad-hoc queries.
+
+Example usage:
+```
+python scripts/corpus.py ingest data
+python scripts/corpus.py query "SELECT spider, COUNT(*) FROM features GROUP BY spider"
+python scripts/corpus.py export --state TX --missing addr:street -o tx.geojson
+python scripts/corpus.py export --bbox=-98,29,-97,31 --tag amenity=fast_food
+```
+
+Raw tags can be queried with SQLite's JSON functions, for example
+`json_extract(properties, '$."addr:street"')`.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import closing, nullcontext
+from typing import Any
+
+from cli_utils import corpus_files
+from jsonstream import FeatureCollectionWriter
+from manifest import file_digest
+from nsi import get_primary_kv
+from serialize import FORMATS, dumps, load, open_text
+
+CORPUS_PATH = "build/corpus.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, spider TEXT, category TEXT, sha256 TEXT,
+    features INTEGER, ingested REAL
+);
+CREATE TABLE IF NOT EXISTS features (
+    fid INTEGER PRIMARY KEY,
+    spider TEXT NOT NULL,
+    id TEXT NOT NULL,
+    feature_id TEXT,
+    file TEXT NOT NULL,
+    category TEXT,
+    brand TEXT,
+    brand_wikidata TEXT,
+    state TEXT,
+    postcode TEXT,
+    primary_key TEXT,
+    primary_value TEXT,
+    lon REAL,
+    lat REAL,
+    min_lon REAL,
+    max_lon REAL,
+    min_lat REAL,
+    max_lat REAL,
+    properties TEXT,
+    geometry TEXT,
+    UNIQUE (spider, id)
+);
+CREATE INDEX IF NOT EXISTS features_file ON features (file);
+CREATE INDEX IF NOT EXISTS features_brand ON features (brand);
+CREATE INDEX IF NOT EXISTS features_wikidata ON features (brand_wikidata);
+CREATE INDEX IF NOT EXISTS features_state ON features (state);
+CREATE INDEX IF NOT EXISTS features_postcode ON features (postcode);
+CREATE INDEX IF NOT EXISTS features_primary ON features (primary_key, primary_value);
+CREATE VIRTUAL TABLE IF NOT EXISTS features_rtree
+    USING rtree (fid, min_lon, max_lon, min_lat, max_lat);
+"""
+
+
+def connect(path: str = CORPUS_PATH) -> sqlite3.Connection:
+    """Open the corpus database, creating its tables if needed."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -65536")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def spider_name(path: str, contents: dict[str, Any]) -> str:
+    """Name the spider a file came from, falling back to the file name."""
+    attributes = contents.get("dataset_attributes") or {}
+    return attributes.get("@spider") or os.path.basename(path).split(".")[0]
+
+
+def feature_key(feature: dict[str, Any]) -> str:
+    """Key a feature by its id, or by a hash of its content if it has none."""
+    if feature.get("id") is not None:
+        return str(feature["id"])
+    text = json.dumps(
+        [feature.get("properties"), feature.get("geometry")], sort_keys=True
+    )
+    return "sha1:" + hashlib.sha1(text.encode()).hexdigest()
+
+
+def bounds(coordinates: Any) -> tuple[float, float, float, float] | None:
+    """Return (min_lon, max_lon, min_lat, max_lat) of nested coordinates."""
+    if not coordinates:
+        return None
+    if isinstance(coordinates[0], (int, float)):
+        lon, lat = coordinates[:2]
+        return lon, lon, lat, lat
+    boxes = [box for part in coordinates if (box := bounds(part))]
+    if not boxes:
+        return None
+    return (
+        min(box[0] for box in boxes),
+        max(box[1] for box in boxes),
+        min(box[2] for box in boxes),
+        max(box[3] for box in boxes),
+    )
+
+
+def feature_row(
+    feature: dict[str, Any], spider: str, path: str, category: str
+) -> tuple:
+    """Split a feature into its indexed columns."""
+    props = feature.get("properties") or {}
+    geometry = feature.get("geometry")
+    box = bounds(geometry.get("coordinates")) if geometry else None
+    try:
+        primary_key, primary_value = get_primary_kv(props)
+    except ValueError:
+        primary_key = primary_value = None
+    return (
+        spider,
+        feature_key(feature),
+        feature.get("id"),
+        path,
+        category,
+        props.get("brand"),
+        props.get("brand:wikidata"),
+        props.get("addr:state"),
+        props.get("addr:postcode"),
+        primary_key,
+        primary_value,
+        (box[0] + box[1]) / 2 if box else None,
+        (box[2] + box[3]) / 2 if box else None,
+        *(box or (None, None, None, None)),
+        dumps(props, "compact"),
+        dumps(geometry, "compact"),
+    )
+
+
+def remove_file(conn: sqlite3.Connection, path: str) -> None:
+    """Drop a file and its features from the corpus."""
+    conn.execute(
+        "DELETE FROM features_rtree WHERE fid IN "
+        "(SELECT fid FROM features WHERE file = ?)",
+        (path,),
+    )
+    conn.execute("DELETE FROM features WHERE file = ?", (path,))
+    conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+
+def ingest_file(conn: sqlite3.Connection, path: str, digest: str) -> tuple[int, int]:
+    """Replace one file's features; return how many were kept and how many repeated."""
+    contents = load(path)
+    features = contents.get("features", [])
+    spider = spider_name(path, contents)
+    category = os.path.basename(os.path.dirname(path))
+
+    with conn:
+        remove_file(conn, path)
+        # a repeated key keeps the first feature with it
+        conn.executemany(
+            f"""INSERT INTO features (
+                spider, id, feature_id, file, category, brand, brand_wikidata,
+                state, postcode, primary_key, primary_value, lon, lat,
+                min_lon, max_lon, min_lat, max_lat, properties, geometry
+            ) VALUES ({",".join("?" * 19)})
+            ON CONFLICT (spider, id) DO NOTHING""",
+            (feature_row(feature, spider, path, category) for feature in features),
+        )
+        conn.execute(
+            """INSERT INTO features_rtree
+            SELECT fid, min_lon, max_lon, min_lat, max_lat FROM features
+            WHERE file = ? AND min_lon IS NOT NULL""",
+            (path,),
+        )
+        (count,) = conn.execute(
+            "SELECT COUNT(*) FROM features WHERE file = ?", (path,)
+        ).fetchone()
+        conn.execute(
+            "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)",
+            (path, spider, category, digest, count, time.time()),
+        )
+    return count, len(features) - count
+
+
+def _under(path: str, roots: tuple[str, ...]) -> bool:
+    """Check whether a path is one of `roots` or inside one of them."""
+    return any(
+        path == root or path.startswith(root.rstrip(os.sep) + os.sep) for root in roots
+    )
+
+
+def ingest(
+    conn: sqlite3.Connection, roots: list[str], prune: bool = True
+) -> dict[str, int]:
+    """
+    Bring the corpus up to date with the GeoJSON files under `roots`.
+
+    Files whose hash matches the last ingest are left alone.
+
+    :param conn: Corpus database connection
+    :param roots: Files and directories to ingest
+    :param prune: Also drop files under `roots` that no longer exist
+    :return: Counts of ingested, unchanged and removed files, of features and
+        of features skipped for repeating a (spider, id) key
+    """
+    stats = {
+        "ingested": 0,
+        "unchanged": 0,
+        "removed": 0,
+        "features": 0,
+        "duplicates": 0,
+    }
+    known = dict(conn.execute("SELECT path, sha256 FROM files"))
+    paths = corpus_files(roots)
+
+    for path in paths:
+        digest = file_digest(path)
+        if known.get(path) == digest:
+            stats["unchanged"] += 1
+            continue
+        try:
+            count, duplicates = ingest_file(conn, path, digest)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Error ingesting {path}: {e}", file=sys.stderr)
+            continue
+        skipped = f", {duplicates} duplicate ids skipped" if duplicates else ""
+        print(f"Ingested: {os.path.relpath(path)} ({count} features{skipped})")
+        stats["ingested"] += 1
+        stats["features"] += count
+        stats["duplicates"] += duplicates
+
+    if prune:
+        present = set(paths)
+        prefixes = tuple(os.path.abspath(root) for root in roots)
+        with conn:
+            for path in known:
+                if _under(path, prefixes) and path not in present:
+                    remove_file(conn, path)
+                    print(f"Removed: {os.path.relpath(path)}")
+                    stats["removed"] += 1
+    return stats
+
+
+def build_filter(args: argparse.Namespace) -> tuple[str, list[Any]]:
+    """Turn export options into a WHERE clause and its parameters."""
+    clauses: list[str] = []
+    params: list[Any] = []
+    for column, values in [
+        ("spider", args.spider),
+        ("brand", args.brand),
+        ("brand_wikidata", args.wikidata),
+        ("state", args.state),
+        ("postcode", args.postcode),
+    ]:
+        if values:
+            clauses.append(f"{column} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+    for tag in args.tag or []:
+        key, _, value = tag.partition("=")
+        clauses.append("primary_key = ?" + (" AND primary_value = ?" if value else ""))
+        params.extend([key, value] if value else [key])
+    for tag in args.missing or []:
+        clauses.append("json_extract(properties, ?) IS NULL")
+        params.append(f'$."{tag}"')
+    if args.bbox:
+        min_lon, min_lat, max_lon, max_lat = args.bbox
+        clauses.append(
+            """fid IN (SELECT fid FROM features_rtree
+            WHERE max_lon >= ? AND min_lon <= ? AND max_lat >= ? AND min_lat <= ?)"""
+        )
+        params.extend([min_lon, max_lon, min_lat, max_lat])
+    if args.where:
+        clauses.append(f"({args.where})")
+    return " AND ".join(clauses) or "1", params
+
+
+def select_features(
+    conn: sqlite3.Connection, where: str = "1", params: list[Any] | None = None
+) -> Iterator[dict[str, Any]]:
+    """Yield the features matching a WHERE clause, in ingest order."""
+    rows = conn.execute(
+        f"""SELECT feature_id, properties, geometry FROM features
+        WHERE {where} ORDER BY fid""",
+        params or [],
+    )
+    for feature_id, properties, geometry in rows:
+        feature: dict[str, Any] = {"type": "Feature"}
+        if feature_id is not None:
+            feature["id"] = feature_id
+        feature["properties"] = json.loads(properties)
+        feature["geometry"] = json.loads(geometry)
+        yield feature
+
+
+def export(
+    conn: sqlite3.Connection,
+    output_path: str | None,
+    where: str = "1",
+    params: list[Any] | None = None,
+    fmt: str = "indent",
+) -> int:
+    """Write matching features as a FeatureCollection and return how many."""
+    count = 0
+    with open_text(output_path, "w") if output_path else nullcontext(sys.stdout) as out:
+        writer = FeatureCollectionWriter(out, fmt)
+        writer.members({"type": "FeatureCollection"})
+        writer.begin_features()
+        for feature in select_features(conn, where, params):
+            writer.feature(feature)
+            count += 1
+        writer.end_features()
+        writer.close()
+    return count
+
+
+def bbox(value: str) -> list[float]:
+    """Parse a min_lon,min_lat,max_lon,max_lat bounding box."""
+    parts = [float(part) for part in value.split(",")]
+    if len(parts) != 4:
+        raise argparse.ArgumentTypeError("expected min_lon,min_lat,max_lon,max_lat")
+    return parts
+
+
+def main():
+    """
+    Main CLI entry point for the corpus database.
+    """
+    parser = argparse.ArgumentParser(description="Query cleaned ATP output in SQLite")
+    parser.add_argument(
+        "--db", default=CORPUS_PATH, help=f"Database file (default: {CORPUS_PATH})"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Add changed files")
+    ingest_parser.add_argument(
+        "paths", nargs="*", default=["data"], help="Files or directories to ingest"
+    )
+    ingest_parser.add_argument(
+        "--keep-removed",
+        action="store_true",
+        help="Keep files that no longer exist on disk",
+    )
+
+    query_parser = subparsers.add_parser("query", help="Run SQL and print rows")
+    query_parser.add_argument("sql", help="SQL statement")
+
+    export_parser = subparsers.add_parser("export", help="Write features as GeoJSON")
+    export_parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    export_parser.add_argument("--spider", action="append", help="Spider name")
+    export_parser.add_argument("--brand", action="append", help="brand tag")
+    export_parser.add_argument("--wikidata", action="append", help="brand:wikidata")
+    export_parser.add_argument("--state", action="append", help="addr:state")
+    export_parser.add_argument("--postcode", action="append", help="addr:postcode")
+    export_parser.add_argument(
+        "--tag", action="append", help="Primary tag as key or key=value"
+    )
+    export_parser.add_argument(
+        "--missing", action="append", help="Only features without this tag"
+    )
+    export_parser.add_argument(
+        "--bbox", type=bbox, help="Bounding box as min_lon,min_lat,max_lon,max_lat"
+    )
+    export_parser.add_argument("--where", help="Extra SQL condition on features")
+    export_parser.add_argument(
+        "--format", choices=FORMATS, default="indent", help="Output layout"
+    )
+
+    args = parser.parse_args()
+
+    with closing(connect(args.db)) as conn:
+        if args.command == "ingest":
+            stats = ingest(conn, args.paths, prune=not args.keep_removed)
+            print(
+                f"{stats['ingested']} files ingested ({stats['features']} features, "
+                f"{stats['duplicates']} duplicate ids skipped), "
+                f"{stats['unchanged']} unchanged, {stats['removed']} removed"
+            )
+        elif args.command == "query":
+            cursor = conn.execute(args.sql)
+            if cursor.description:
+                print("\t".join(column[0] for column in cursor.description))
+            for row in cursor:
+                print("\t".join("" if value is None else str(value) for value in row))
+        else:
+            where, params = build_filter(args)
+            count = export(conn, args.output, where, params, args.format)
+            if args.output:
+                print(f"Exported {count} features to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Find features that describe the same storefront, within or across spiders.
+
+Example usage:
+```
+python scripts/dedup.py data -o build/duplicates.json
+python scripts/dedup.py data/big_box --radius 50 --min-score 2
+```
+
+Features are bucketed into grid cells and only compared with features in
+neighbouring cells, so the search grows linearly with the corpus.
+"""
+
+import argparse
+import os
+import re
+from collections import Counter
+from typing import Any
+
+from cli_utils import corpus_files
+from corpus import spider_name
+from match import GridIndex, distance
+from resources import overlap_tags
+from serialize import FORMATS, dump, load
+
+RADIUS = 100  # metres
+MIN_SCORE = 1.5
+REPORT_PATH = "build/duplicates.json"
+
+_non_alnum = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_address(props: dict[str, Any]) -> str | None:
+    """Reduce a street address to lowercase letters and digits."""
+    street = props.get("addr:street")
+    if not street:
+        return None
+    text = f"{props.get('addr:housenumber', '')} {street}".casefold()
+    return _non_alnum.sub(" ", text).strip() or None
+
+
+def normalize_phone(value: str) -> str | None:
+    """Keep the last ten digits of the first listed phone number."""
+    digits = re.sub(r"\D", "", str(value).split(";")[0])
+    return digits[-10:] or None
+
+
+def normalize_website(value: str) -> str | None:
+    """Drop the scheme, www. and trailing slashes from a URL."""
+    url = str(value).split(";")[0].strip().casefold()
+    url = re.sub(r"^[a-z]+://(www\.)?", "", url).rstrip("/")
+    return url or None
+
+
+def overlap_value(props: dict[str, Any], group: list[str]) -> str | None:
+    """Return the first value among tags that mean the same thing."""
+    for tag in group:
+        if props.get(tag):
+            return props[tag]
+    return None
+
+
+def fingerprint(props: dict[str, Any]) -> dict[str, str | None]:
+    """Collect the normalized values two duplicates would share."""
+    values = {"address": normalize_address(props), "ref": props.get("ref")}
+    for group in overlap_tags:
+        value = overlap_value(props, group)
+        if group[0] == "phone":
+            values["phone"] = normalize_phone(value) if value else None
+        elif group[0] == "website":
+            values["website"] = normalize_website(value) if value else None
+    values["brand"] = props.get("brand:wikidata") or props.get("brand")
+    return values
+
+
+def score_pair(
+    a: dict[str, Any], b: dict[str, Any], dist: float, radius: float
+) -> tuple[float, list[str]]:
+    """Rate how likely two features are the same place, with the reasons."""
+    total = 1 - dist / radius
+    reasons = []
+    same_brand = a["brand"] is not None and a["brand"] == b["brand"]
+    for field, weight in [("address", 1.0), ("phone", 1.0), ("website", 0.5)]:
+        if a[field] and a[field] == b[field]:
+            total += weight
+            reasons.append(field)
+        elif field == "address" and a[field] and b[field]:
+            total -= 0.5
+    # neighbouring brands share plaza addresses; only shared contacts count
+    if a["brand"] and b["brand"] and not same_brand:
+        if "phone" not in reasons and "website" not in reasons:
+            return 0.0, reasons
+    # refs are only comparable between records of the same brand
+    if same_brand and a["ref"] and str(a["ref"]) == str(b["ref"]):
+        total += 1.0
+        reasons.append("ref")
+    if same_brand:
+        total += 0.5
+        reasons.append("brand")
+    return total, reasons
+
+
+def load_features(paths: list[str]) -> list[dict[str, Any]]:
+    """Read the point features of every file with what dedup compares."""
+    records = []
+    for path in paths:
+        contents = load(path)
+        spider = spider_name(path, contents)
+        for feature in contents.get("features", []):
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") != "Point":
+                continue
+            props = feature.get("properties", {})
+            lon, lat = geometry["coordinates"][:2]
+            records.append(
+                {
+                    "spider": spider,
+                    "file": os.path.relpath(path),
+                    "id": feature.get("id") or props.get("ref"),
+                    "name": props.get("name"),
+                    "lon": lon,
+                    "lat": lat,
+                    **fingerprint(props),
+                }
+            )
+    return records
+
+
+def find_duplicates(
+    records: list[dict[str, Any]],
+    radius: float = RADIUS,
+    min_score: float = MIN_SCORE,
+) -> list[dict[str, Any]]:
+    """
+    Pair up features that are probably the same place.
+
+    :param records: Features from `load_features`
+    :param radius: Largest distance in metres between duplicates
+    :param min_score: Lowest score to report
+    :return: Pairs, best first
+    """
+    grid = GridIndex()
+    for i, record in enumerate(records):
+        grid.add(i, record["lon"], record["lat"])
+
+    pairs = []
+    for i, a in enumerate(records):
+        for j in grid.near(a["lon"], a["lat"], radius):
+            # each pair once
+            if j <= i:
+                continue
+            b = records[j]
+            dist = distance(a["lon"], a["lat"], b["lon"], b["lat"])
+            if dist > radius:
+                continue
+            total, reasons = score_pair(a, b, dist, radius)
+            if total >= min_score:
+                pairs.append(
+                    {
+                        "score": round(total, 3),
+                        "distance": round(dist, 1),
+                        "reasons": reasons,
+                        "a": _describe(a),
+                        "b": _describe(b),
+                    }
+                )
+    pairs.sort(key=lambda pair: pair["score"], reverse=True)
+    return pairs
+
+
+def _describe(record: dict[str, Any]) -> dict[str, Any]:
+    """Identify a feature in the report."""
+    return {
+        key: record[key]
+        for key in ("spider", "file", "id", "name", "address", "lon", "lat")
+    }
+
+
+def main():
+    """
+    Main CLI entry point for duplicate detection.
+    """
+    parser = argparse.ArgumentParser(description="Report likely duplicate features")
+    parser.add_argument(
+        "paths", nargs="*", default=["data"], help="Files or directories to check"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=REPORT_PATH,
+        help=f"Report file (default: {REPORT_PATH})",
+    )
+    parser.add_argument(
+        "--radius",
+        type=float,
+        default=RADIUS,
+        help=f"Largest distance in metres between duplicates (default: {RADIUS})",
+    )
+    parser.add_argument(
+        "--min-score",
+        type=float,
+        default=MIN_SCORE,
+        help=f"Lowest score to report (default: {MIN_SCORE})",
+    )
+    parser.add_argument(
+        "--format", choices=FORMATS, default="indent", help="Report layout"
+    )
+
+    args = parser.parse_args()
+
+    records = load_features(corpus_files(args.paths))
+    pairs = find_duplicates(records, args.radius, args.min_score)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    dump({"radius": args.radius, "pairs": pairs}, args.output, args.format)
+
+    print(f"Compared {len(records)} features: {len(pairs)} likely duplicates")
+    spider_pairs = Counter(
+        tuple(sorted((pair["a"]["spider"], pair["b"]["spider"]))) for pair in pairs
+    )
+    for (first, second), count in spider_pairs.most_common(20):
+        label = first if first == second else f"{first} / {second}"
+        print(f"  {label:<48}{count:>8}")
+    print(f"Report saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
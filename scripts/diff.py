@@ -0,0 +1,261 @@
+"""
+Compare a new ATP crawl with the previously cleaned file and clean only what changed.
+
+Example usage:
+```
+python scripts/diff.py --old data/hotel/hyatt.geojson --new output/hyatt.geojson
+python scripts/diff.py --old data/hotel --new output --report build/diff.json
+```
+
+Features are keyed by ATP id, then ref. Each is classified as added,
+removed, moved, retagged or unchanged; only added, moved and retagged
+features are cleaned, and unchanged ones are copied from the old file.
+
+A hidden sidecar next to the output remembers the key and a hash of every
+raw feature, so later runs can match features without an id or ref and
+tell unchanged features apart without cleaning them. On the first run, or
+when the cleaning settings change, every feature is cleaned and compared
+with the old output instead.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from typing import Any
+
+from clean import (
+    RULES,
+    VERSION,
+    Pipeline,
+    SkipFileError,
+    clean_attributes,
+    select_rules,
+)
+from cli_utils import is_geojson
+from corpus import feature_key as content_key
+from match import distance
+from serialize import FORMATS, dump, load
+
+CHANGES = ["added", "removed", "moved", "retagged"]
+
+
+def sidecar_path(output_path: str) -> str:
+    """Name the file holding the raw hashes of an output."""
+    directory, name = os.path.split(output_path)
+    return os.path.join(directory, f".{name}.diff.json")
+
+
+def feature_key(feature: dict[str, Any]) -> str:
+    """Key a feature by its ATP id, then its ref, then its content."""
+    if feature.get("id") is not None:
+        return f"id:{feature['id']}"
+    ref = (feature.get("properties") or {}).get("ref")
+    if ref:
+        return f"ref:{ref}"
+    return content_key(feature)
+
+
+def keyed(features: list[dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    """Index features by key, numbering repeated keys in order."""
+    index: dict[str, dict[str, Any]] = {}
+    for feature in features:
+        key = base = feature_key(feature)
+        count = 1
+        while key in index:
+            count += 1
+            key = f"{base}#{count}"
+        index[key] = feature
+    return index
+
+
+def _digest(value: Any) -> str:
+    """Hash a JSON value independently of key order."""
+    text = json.dumps(value, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def raw_hashes(feature: dict[str, Any]) -> list[str]:
+    """Hash a raw feature's properties and geometry separately."""
+    return [_digest(feature.get("properties")), _digest(feature.get("geometry"))]
+
+
+def _moved(old: dict[str, Any], new: dict[str, Any]) -> float | None:
+    """Return how far a point moved, or None if it stayed put."""
+    if old.get("geometry") == new.get("geometry"):
+        return None
+    try:
+        lon1, lat1 = old["geometry"]["coordinates"][:2]
+        lon2, lat2 = new["geometry"]["coordinates"][:2]
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+    return round(distance(lon1, lat1, lon2, lat2), 1)
+
+
+def diff_file(
+    old_path: str | None,
+    new_path: str,
+    output_path: str,
+    rules: list[str] | None = None,
+    fmt: str = "indent",
+) -> dict[str, Any]:
+    """
+    Merge a new raw crawl into its cleaned predecessor.
+
+    :param old_path: Previously cleaned GeoJSON file, if there is one
+    :param new_path: New raw GeoJSON crawl
+    :param output_path: Where to write the merged, cleaned file
+    :param rules: Names of the cleaning rules to apply (default: all)
+    :param fmt: Output layout, one of `serialize.FORMATS`
+    :return: Keys per change type and counts of unchanged and cleaned features
+    """
+    contents = load(new_path)
+    attributes = clean_attributes(contents.get("dataset_attributes"))
+    pipeline = Pipeline(rules)
+    features = [obj for obj in contents["features"] if pipeline.observe(obj)]
+    wipe_repeat_tags = pipeline.finish()["wipe_repeat_tags"]
+
+    old_features = load(old_path)["features"] if old_path else []
+    settings = {
+        "version": VERSION,
+        "rules": list(RULES) if rules is None else rules,
+        "wipe_repeat_tags": wipe_repeat_tags,
+    }
+    sidecar: dict[str, Any] = {}
+    if old_path and os.path.exists(sidecar_path(old_path)):
+        with open(sidecar_path(old_path), "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+
+    # cleaning changes content, so old features are keyed as their raw input was
+    keys = sidecar.get("keys")
+    if keys is not None and len(keys) == len(old_features):
+        old = dict(zip(keys, old_features))
+    else:
+        old = keyed(old_features)
+    # cleaned output from other settings cannot be reused as-is
+    known = sidecar.get("features", {}) if sidecar.get("settings") == settings else {}
+
+    report: dict[str, Any] = {change: [] for change in CHANGES}
+    report["unchanged"] = report["cleaned"] = 0
+    merged = []
+    hashes = {}
+    for key, raw in keyed(features).items():
+        hashes[key] = raw_hashes(raw)
+        previous = old.get(key)
+        if previous is not None and known.get(key) == hashes[key]:
+            merged.append(previous)
+            report["unchanged"] += 1
+            continue
+
+        moved = _moved(previous, raw) if previous is not None else None
+        cleaned = pipeline.apply(raw)
+        report["cleaned"] += 1
+        if previous is None:
+            report["added"].append(key)
+        elif moved is None and cleaned["properties"] == previous["properties"]:
+            report["unchanged"] += 1
+        else:
+            if moved is not None:
+                report["moved"].append({"key": key, "distance": moved})
+            if cleaned["properties"] != previous["properties"]:
+                report["retagged"].append(key)
+        merged.append(cleaned)
+    report["removed"] = [key for key in old if key not in hashes]
+
+    contents["features"] = merged
+    contents["dataset_attributes"] = attributes
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    dump(contents, output_path, fmt)
+    with open(sidecar_path(output_path), "w", encoding="utf-8") as f:
+        json.dump({"settings": settings, "features": hashes, "keys": list(hashes)}, f)
+    return report
+
+
+def summary(name: str, report: dict[str, Any]) -> str:
+    """Describe one file's changes on a line."""
+    counts = ", ".join(f"{len(report[change])} {change}" for change in CHANGES)
+    return (
+        f"{name}: {counts}, {report['unchanged']} unchanged "
+        f"({report['cleaned']} cleaned)"
+    )
+
+
+def main():
+    """
+    Main CLI entry point for crawl diffs.
+    """
+    parser = argparse.ArgumentParser(
+        description="Clean only the features that changed since the last crawl"
+    )
+    parser.add_argument(
+        "--old", required=True, help="Previously cleaned file or directory"
+    )
+    parser.add_argument("--new", required=True, help="New raw crawl file or directory")
+    parser.add_argument(
+        "-o", "--output", help="Output file or directory (default: replace --old)"
+    )
+    parser.add_argument("--report", help="Write the changed keys to this JSON file")
+    parser.add_argument(
+        "--rules",
+        type=lambda value: value.split(","),
+        help="Comma-separated cleaning rules to apply (default: all)",
+    )
+    parser.add_argument(
+        "--skip-rules",
+        type=lambda value: value.split(","),
+        help="Comma-separated cleaning rules to leave out",
+    )
+    parser.add_argument(
+        "--format", choices=FORMATS, default="indent", help="Output layout"
+    )
+
+    args = parser.parse_args()
+
+    try:
+        rules = select_rules(args.rules, args.skip_rules)
+    except ValueError as e:
+        parser.error(f"{e} (available: {', '.join(RULES)})")
+
+    output = args.output or args.old
+    if os.path.isdir(args.new):
+        names = sorted(name for name in os.listdir(args.new) if is_geojson(name))
+        jobs = [
+            (
+                os.path.join(args.old, name)
+                if os.path.exists(os.path.join(args.old, name))
+                else None,
+                os.path.join(args.new, name),
+                os.path.join(output, name),
+            )
+            for name in names
+        ]
+    else:
+        jobs = [(args.old, args.new, output)]
+
+    reports = {}
+    failed = False
+    for old_path, new_path, output_path in jobs:
+        name = os.path.basename(new_path)
+        try:
+            reports[name] = diff_file(
+                old_path, new_path, output_path, rules, args.format
+            )
+        except SkipFileError:
+            print(f"Skipped: {name}")
+            continue
+        except Exception as e:
+            print(f"Error processing {name}: {e}")
+            failed = True
+            continue
+        print(summary(name, reports[name]))
+
+    if args.report:
+        dump(reports, args.report)
+        print(f"Report saved to: {args.report}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
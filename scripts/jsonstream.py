@@ -0,0 +1,308 @@
+"""
+Read and write large JSON documents incrementally.
+
+The reader decodes one value at a time from a buffered text stream, so a
+FeatureCollection can be walked feature by feature without holding the whole
+document in memory. The writer emits the same text as `serialize.dumps` in
+each of its layouts.
+"""
+
+import json
+import os
+import re
+from collections.abc import Iterable, Iterator
+from typing import Any, TextIO
+
+from serialize import dumps, dumps_value, open_binary, open_text
+
+_WHITESPACE = " \t\n\r"
+_decoder = json.JSONDecoder()
+_colon = re.compile(r"\s*:\s*")
+
+
+class JSONStreamReader:
+    """Pull values out of a JSON text stream one at a time."""
+
+    def __init__(self, stream: TextIO, chunk_size: int = 1 << 16):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Append the next chunk to the buffer, dropping consumed text."""
+        if self._eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Return the next non-whitespace character without consuming it."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str) -> None:
+        """Consume the given structural character."""
+        found = self._peek()
+        if found != char:
+            raise json.JSONDecodeError(
+                f"Expecting {char!r}, found {found or 'end of file'!r}",
+                self._buf,
+                self._pos,
+            )
+        self._pos += 1
+
+    def read_value(self) -> Any:
+        """Decode and return the next complete JSON value."""
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self._buf) and not self._eof and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def skip_value(self) -> None:
+        """Consume the next value, one array item or object member at a time."""
+        char = self._peek()
+        if char == "[":
+            for _ in self.iter_array():
+                pass
+        elif char == "{":
+            for _ in self.iter_object():
+                self.skip_value()
+        else:
+            self.read_value()
+
+    def iter_array(self) -> Iterator[Any]:
+        """Yield each decoded item of the array at the current position."""
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.read_value()
+            if self._peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("]")
+            return
+
+    def iter_object(self) -> Iterator[str]:
+        """
+        Yield each key of the object at the current position.
+
+        The caller must consume the member's value (with `read_value`,
+        `skip_value`, `iter_array` or `iter_object`) before advancing.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self._expect(":")
+            yield key
+            if self._peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("}")
+            return
+
+
+def read_collection(
+    stream: TextIO, member: str = "features"
+) -> Iterator[tuple[str, Any]]:
+    """
+    Walk the top-level members of a JSON object.
+
+    Every member is yielded as a `(key, value)` pair, except `member`, whose
+    value is yielded as a lazy iterator over its array items. That iterator
+    must be exhausted before the walk continues.
+    """
+    reader = JSONStreamReader(stream)
+    for key in reader.iter_object():
+        if key == member:
+            yield key, reader.iter_array()
+        else:
+            yield key, reader.read_value()
+
+
+def read_member(
+    path: str, key: str, before: str = "features", tail_size: int = 1 << 16
+) -> Any:
+    """
+    Read one small top-level member without decoding the rest of the file.
+
+    Members ahead of `before` are read from the head of the file. Otherwise
+    the last `tail_size` bytes are searched, which covers members written
+    after the features array. Returns None when the member is not found.
+    """
+    with open_text(path) as f:
+        reader = JSONStreamReader(f)
+        for name in reader.iter_object():
+            if name == key:
+                return reader.read_value()
+            if name == before:
+                break
+            reader.skip_value()
+        else:
+            return None
+
+    with open_binary(path) as f:
+        if path.endswith(".gz"):
+            # compressed files cannot seek from the end
+            tail = b""
+            while chunk := f.read(tail_size):
+                tail = (tail + chunk)[-tail_size:]
+        else:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - tail_size))
+            tail = f.read()
+    tail = tail.decode("utf-8", errors="ignore")
+
+    name = json.dumps(key)
+    idx = tail.rfind(name)
+    while idx != -1:
+        colon = _colon.match(tail, idx + len(name))
+        if colon:
+            try:
+                value, end = _decoder.raw_decode(tail, colon.end())
+            except json.JSONDecodeError:
+                pass
+            else:
+                # only accept a member of the outermost object
+                if tail[end:].strip() == "}" or tail[end:].lstrip().startswith(","):
+                    return value
+        idx = tail.rfind(name, 0, idx)
+    return None
+
+
+class FeatureCollectionWriter:
+    """Write a FeatureCollection one feature at a time."""
+
+    def __init__(self, stream: TextIO, fmt: str = "indent"):
+        self.stream = stream
+        self.fmt = fmt
+        compact = fmt == "compact"
+        self._newline = "" if compact else "\n"
+        self._pad = "" if compact else "  "
+        self._colon = ":" if compact else ": "
+        self._started = False
+        self._first_feature = True
+        # the last value written; prettier lays it out by whether a comma follows
+        self._pending: tuple[Any, int, int] | None = None
+        # prettier collapses small documents onto fewer lines, so hold the
+        # document back until it has two features and must break
+        self._held: dict[str, Any] | None = {} if fmt == "prettier" else None
+        self._features_key = "features"
+
+    def _flush(self, trailing: int) -> None:
+        """Write the pending value now that what follows it is known."""
+        if self._pending is not None:
+            value, level, column = self._pending
+            self.stream.write(dumps_value(value, self.fmt, level, column, trailing))
+            self._pending = None
+
+    def _key(self, key: str) -> None:
+        """Write the separator and key for the next top-level member."""
+        self._flush(1)
+        prefix = ("{" if not self._started else ",") + self._newline + self._pad
+        self.stream.write(prefix + json.dumps(key) + self._colon)
+        self._started = True
+
+    def _release(self) -> None:
+        """Write out a held-back document once its layout is settled."""
+        held, self._held = self._held or {}, None
+        features = held.pop(self._features_key)
+        self.members(held)
+        self.begin_features(self._features_key)
+        for feature in features:
+            self.feature(feature)
+
+    def members(self, members: dict[str, Any]) -> None:
+        """Write plain top-level members."""
+        for key, value in members.items():
+            if self._held is not None:
+                self._held[key] = value
+                continue
+            self._key(key)
+            self._pending = (value, 1, len(self._pad + json.dumps(key) + self._colon))
+
+    def begin_features(self, key: str = "features") -> None:
+        """Open the features array."""
+        self._features_key = key
+        if self._held is not None:
+            self._held[key] = []
+            return
+        self._key(key)
+        self.stream.write("[")
+        self._first_feature = True
+
+    def feature(self, feature: dict[str, Any]) -> None:
+        """Append a single feature to the open features array."""
+        if self._held is not None:
+            self._held[self._features_key].append(feature)
+            if len(self._held[self._features_key]) > 1:
+                self._release()
+            return
+        self._flush(1)
+        separator = "" if self._first_feature else ","
+        self.stream.write(separator + self._newline + self._pad * 2)
+        self._pending = (feature, 2, len(self._pad * 2))
+        self._first_feature = False
+
+    def end_features(self) -> None:
+        """Close the features array."""
+        if self._held is not None:
+            return
+        self._flush(0)
+        if self._first_feature:
+            self.stream.write("]")
+        else:
+            self.stream.write(self._newline + self._pad + "]")
+
+    def close(self) -> None:
+        """Close the top-level object."""
+        if self._held is not None:
+            self.stream.write(dumps(self._held, self.fmt))
+            return
+        self._flush(0)
+        self.stream.write(self._newline + "}" if self._started else "{}")
+        if self.fmt == "prettier":
+            self.stream.write("\n")
+
+
+def write_collection(
+    stream: TextIO,
+    header: dict[str, Any],
+    features: Iterable[dict[str, Any]],
+    trailer: dict[str, Any] | None = None,
+    fmt: str = "indent",
+) -> None:
+    """Write members, then every feature, then trailing members."""
+    writer = FeatureCollectionWriter(stream, fmt)
+    writer.members(header)
+    writer.begin_features()
+    for feature in features:
+        writer.feature(feature)
+    writer.end_features()
+    writer.members(trailer or {})
+    writer.close()
@@ -0,0 +1,56 @@
+"""Remember which inputs a directory run has already cleaned."""
+
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = ".clean_manifest.json"
+
+
+def file_digest(path: str) -> str:
+    """Hash a file's bytes without parsing it."""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+class Manifest:
+    """Input hashes, cleaning versions and outputs of previous runs."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+
+    def entry(
+        self,
+        digest: str,
+        version: str,
+        output: str,
+        rules: list[str],
+        fmt: str = "indent",
+    ) -> dict[str, object]:
+        """Build the record describing one cleaned input."""
+        return {
+            "sha256": digest,
+            "version": version,
+            "output": output,
+            "rules": rules,
+            "format": fmt,
+        }
+
+    def is_current(self, name: str, entry: dict[str, object]) -> bool:
+        """Check whether an input was already cleaned with the same settings."""
+        return self.files.get(name) == entry and os.path.exists(str(entry["output"]))
+
+    def record(self, name: str, entry: dict[str, object]) -> None:
+        """Store the settings an input was cleaned with."""
+        self.files[name] = entry
+
+    def save(self) -> None:
+        """Write the manifest, replacing the previous one atomically."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
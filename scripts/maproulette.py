@@ -0,0 +1,253 @@
+"""
+Build MapRoulette cooperative challenge files from cleaned data.
+
+Example usage:
+```
+python scripts/maproulette.py data/missing.osm -o build/missing_new.json
+python scripts/maproulette.py build/match/missing.geojson --split-by state -j 0
+```
+
+Each line of the output is one task: a record separator, then a
+FeatureCollection holding the new node and, base64 encoded, the osmChange
+that creates it. This is the layout `mr cooperative change` writes.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import re
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import batched
+from typing import Any, TextIO
+
+from match import iter_xml
+from osm_export import coordinate, feature_tags, input_files, iter_features
+from serialize import open_text
+
+BATCH_SIZE = 500
+SPLIT_KEYS = {"state": "addr:state", "brand": "brand"}
+
+_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"})
+
+
+def iter_nodes(paths: list[str], start_id: int = -1) -> Iterator[dict[str, Any]]:
+    """
+    Yield new nodes from OSM XML or GeoJSON files.
+
+    OSM nodes keep their ids; GeoJSON features get negative ids counting
+    down from `start_id`. Untagged OSM nodes, such as the vertices of ways,
+    are skipped.
+    """
+    next_id = start_id
+    for path in paths:
+        if path.endswith((".osm", ".osm.gz")):
+            for elem in iter_xml(path, "node"):
+                tags = {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+                if not tags:
+                    continue
+                yield {
+                    "id": int(elem.get("id")),
+                    "lon": float(elem.get("lon")),
+                    "lat": float(elem.get("lat")),
+                    "tags": tags,
+                }
+            continue
+        for feature in iter_features([path]):
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") != "Point" or "osm" in feature:
+                continue
+            lon, lat = geometry["coordinates"][:2]
+            yield {"id": next_id, "lon": lon, "lat": lat, "tags": feature_tags(feature)}
+            next_id -= 1
+
+
+def osm_change(node: dict[str, Any]) -> str:
+    """Write the osmChange creating a node, as mr-cli lays it out."""
+    lines = [
+        "<?xml version='1.0' encoding='UTF-8'?>",
+        "<osmChange version='0.6'>",
+        "  <create>",
+        f'  <node id="{node["id"]}" lat="{coordinate(node["lat"])}"'
+        f' lon="{coordinate(node["lon"])}">',
+    ]
+    lines += [
+        f'    <tag k="{k.translate(_ESCAPES)}" v="{str(v).translate(_ESCAPES)}"/>'
+        for k, v in node["tags"].items()
+    ]
+    lines += ["  </node>", "  </create>", "</osmChange>"]
+    return "\n".join(lines)
+
+
+def task(node: dict[str, Any]) -> str:
+    """Serialize the cooperative task adding one node, without a line break."""
+    content = base64.b64encode(osm_change(node).encode("utf-8")).decode("ascii")
+    collection = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": node["tags"] | {"@id": f"node/{node['id']}"},
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [node["lon"], node["lat"]],
+                },
+            }
+        ],
+        "cooperativeWork": {
+            "meta": {"version": 2, "type": 2},
+            "file": {
+                "type": "xml",
+                "format": "osc",
+                "encoding": "base64",
+                "content": content,
+            },
+        },
+    }
+    return "\x1e" + json.dumps(collection, ensure_ascii=False, separators=(",", ":"))
+
+
+def build_tasks(
+    nodes: tuple[dict[str, Any], ...], split_by: str | None = None
+) -> list[tuple[str, str]]:
+    """Serialize a batch of tasks along with the file each belongs in."""
+    tag = SPLIT_KEYS.get(split_by or "")
+    return [
+        (str(node["tags"].get(tag) or "unknown") if tag else "", task(node))
+        for node in nodes
+    ]
+
+
+def _results(
+    batches: Iterable[tuple[dict[str, Any], ...]], split_by: str | None, jobs: int
+) -> Iterator[list[tuple[str, str]]]:
+    """Build batches in worker processes, keeping a bounded number in flight."""
+    if jobs <= 1:
+        for batch in batches:
+            yield build_tasks(batch, split_by)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(build_tasks, batch, split_by))
+            if len(pending) >= jobs * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def split_path(output_path: str, key: str, hashed: bool = False) -> str:
+    """
+    Name the file holding one group of a split challenge.
+
+    With `hashed`, a short hash of the key is appended, to tell apart keys
+    that only differ in the characters left out of file names.
+    """
+    if not key:
+        return output_path
+    base, ext = os.path.splitext(output_path)
+    name = re.sub(r"[^A-Za-z0-9]+", "_", key).strip("_") or "unknown"
+    if hashed:
+        name += "_" + hashlib.sha1(key.encode()).hexdigest()[:8]
+    return f"{base}_{name}{ext}"
+
+
+def build_challenge(
+    paths: list[str],
+    output_path: str,
+    split_by: str | None = None,
+    jobs: int = 1,
+    start_id: int = -1,
+) -> dict[str, int]:
+    """
+    Stream cooperative tasks for every new node into line-delimited files.
+
+    :param paths: OSM XML or GeoJSON files with the objects to add
+    :param output_path: Task file, or name pattern when splitting
+    :param split_by: Write one file per "state" or "brand"
+    :param jobs: Number of worker processes (0 for one per CPU)
+    :param start_id: Id of the first new node made from GeoJSON
+    :return: Number of tasks written per output file
+    """
+    jobs = jobs or os.cpu_count() or 1
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    files: dict[str, TextIO] = {}
+    counts: dict[str, int] = {}
+    key_paths: dict[str, str] = {}
+    try:
+        batches = batched(iter_nodes(paths, start_id), BATCH_SIZE)
+        for results in _results(batches, split_by, jobs):
+            for key, line in results:
+                path = key_paths.get(key)
+                if path is None:
+                    path = split_path(output_path, key)
+                    # another key already has this name
+                    if path in files:
+                        path = split_path(output_path, key, hashed=True)
+                    key_paths[key] = path
+                    files[path] = open_text(path, "w")
+                    counts[path] = 0
+                files[path].write(line + "\n")
+                counts[path] += 1
+    finally:
+        for f in files.values():
+            f.close()
+    return counts
+
+
+def main():
+    """
+    Main CLI entry point for MapRoulette challenge files.
+    """
+    parser = argparse.ArgumentParser(
+        description="Build MapRoulette cooperative challenge tasks"
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="OSM XML or GeoJSON files or directories"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="build/missing_new.json",
+        help="Task file (default: build/missing_new.json)",
+    )
+    parser.add_argument(
+        "--split-by",
+        choices=list(SPLIT_KEYS),
+        help="Write one task file per state or brand",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes building tasks (default: 1, 0 for one per CPU)",
+    )
+    parser.add_argument(
+        "--start-id",
+        type=int,
+        default=-1,
+        help="Id of the first new node made from GeoJSON (default: -1)",
+    )
+
+    args = parser.parse_args()
+
+    if args.start_id >= 0:
+        parser.error("--start-id must be negative")
+
+    counts = build_challenge(
+        input_files(args.paths),
+        args.output,
+        split_by=args.split_by,
+        jobs=args.jobs,
+        start_id=args.start_id,
+    )
+    for path, count in counts.items():
+        print(f"{count} tasks saved to: {path}")
+
+
+if __name__ == "__main__":
+    main()
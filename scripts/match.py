@@ -0,0 +1,485 @@
+"""
+Match cleaned ATP features to existing objects in a local OSM extract.
+
+Example usage:
+```
+python scripts/match.py -d data/grocery --osm us-latest.osm.pbf -o build/match
+python scripts/match.py -f data/grocery/lidl_us.geojson --osm extract.osm
+```
+
+Features are written to matched, ambiguous and missing GeoJSON files in the
+output directory. Matched features carry the OSM object under a top-level
+"osm" member; ambiguous ones list their candidates under "candidates".
+
+Reading .osm.pbf files needs the optional `osmium` package; plain and
+gzip-compressed .osm XML is read with the standard library.
+"""
+
+import math
+import os
+import sys
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from collections.abc import Iterator
+from typing import Any
+
+from cli_utils import create_geojson_parser, is_geojson
+from jsonstream import FeatureCollectionWriter
+from nsi import get_primary_kv
+from serialize import load, open_binary, open_text
+
+try:
+    import osmium
+except ImportError:  # pragma: no cover - depends on the environment
+    osmium = None
+
+RADIUS = 250  # metres
+CELL_SIZE = 0.01  # degrees, about 1 km north-south
+EARTH_RADIUS = 6371008.8
+PRIMARY_KEYS = [
+    "amenity",
+    "shop",
+    "tourism",
+    "leisure",
+    "craft",
+    "office",
+    "healthcare",
+]
+OUTPUTS = ["matched", "ambiguous", "missing"]
+
+# a candidate this far ahead of the runner-up is taken without ambiguity
+CLEAR_LEAD = 1.0
+
+
+class OsmFilter:
+    """Decide which OSM objects could match the ATP features being processed."""
+
+    def __init__(self, features: list[dict[str, Any]]):
+        self.wikidata: set[str] = set()
+        self.primary: set[tuple[str, str]] = set()
+        for feature in features:
+            props = feature["properties"]
+            if props.get("brand:wikidata"):
+                self.wikidata.add(props["brand:wikidata"])
+            try:
+                self.primary.add(get_primary_kv(props))
+            except ValueError:
+                pass
+
+    def wanted(self, tags: dict[str, str]) -> bool:
+        """Check whether an object's tags make it a possible match."""
+        if tags.get("brand:wikidata") in self.wikidata:
+            return True
+        return any((key, tags.get(key)) in self.primary for key in PRIMARY_KEYS)
+
+
+def _tags(elem: ET.Element) -> dict[str, str]:
+    """Collect the tags of an OSM XML element."""
+    return {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+
+
+def iter_xml(path: str, kind: str) -> Iterator[ET.Element]:
+    """Yield the elements of one kind from an OSM XML file, freeing the rest."""
+    with open_binary(path) as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end" or elem.tag not in ("node", "way", "relation"):
+                continue
+            if elem.tag == kind:
+                yield elem
+            root.clear()
+
+
+def _centre(points: list[tuple[float, float]]) -> tuple[float, float] | None:
+    """Return the centre of the bounding box of some points."""
+    if not points:
+        return None
+    lons = [lon for lon, _ in points]
+    lats = [lat for _, lat in points]
+    return (min(lons) + max(lons)) / 2, (min(lats) + max(lats)) / 2
+
+
+def read_osm_xml(path: str, osm_filter: OsmFilter) -> list[dict[str, Any]]:
+    """
+    Read the wanted objects of an OSM XML file in three streaming passes.
+
+    OSM files list nodes, then ways, then relations, so relations are read
+    first to learn which ways they need, then ways to learn which nodes.
+    """
+    relations = []
+    member_ways: set[int] = set()
+    for elem in iter_xml(path, "relation"):
+        tags = _tags(elem)
+        if osm_filter.wanted(tags):
+            members = [
+                {"type": m.get("type"), "ref": int(m.get("ref")), "role": m.get("role")}
+                for m in elem.iter("member")
+            ]
+            relations.append(_element(elem, tags, members=members))
+            member_ways.update(
+                m["ref"]
+                for m in members
+                if m["type"] == "way" and m["role"] in ("outer", "")
+            )
+
+    ways = []
+    way_nodes: dict[int, list[int]] = {}
+    for elem in iter_xml(path, "way"):
+        way_id = int(elem.get("id"))
+        tags = _tags(elem)
+        wanted = osm_filter.wanted(tags)
+        if wanted or way_id in member_ways:
+            refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+            way_nodes[way_id] = refs
+            if wanted:
+                ways.append(_element(elem, tags, nodes=refs))
+
+    needed = {ref for refs in way_nodes.values() for ref in refs}
+    nodes = []
+    locations: dict[int, tuple[float, float]] = {}
+    for elem in iter_xml(path, "node"):
+        node_id = int(elem.get("id"))
+        location = (float(elem.get("lon")), float(elem.get("lat")))
+        if node_id in needed:
+            locations[node_id] = location
+        if len(elem):
+            tags = _tags(elem)
+            if osm_filter.wanted(tags):
+                nodes.append(_element(elem, tags, centre=location))
+
+    for way in ways:
+        way["lon"], way["lat"] = _centre(
+            [locations[ref] for ref in way["nodes"] if ref in locations]
+        ) or (None, None)
+    for relation in relations:
+        points = [
+            locations[ref]
+            for m in relation["members"]
+            if m["type"] == "way" and m["role"] in ("outer", "")
+            for ref in way_nodes.get(m["ref"], [])
+            if ref in locations
+        ]
+        relation["lon"], relation["lat"] = _centre(points) or (None, None)
+
+    return [
+        element for element in nodes + ways + relations if element["lon"] is not None
+    ]
+
+
+def _element(
+    elem: ET.Element,
+    tags: dict[str, str],
+    centre: tuple[float, float] | None = None,
+    **members: Any,
+) -> dict[str, Any]:
+    """Describe an OSM object as a JSON-friendly dict."""
+    element = {
+        "type": elem.tag,
+        "id": int(elem.get("id")),
+        "version": int(elem.get("version", 0)) or None,
+        "lon": centre[0] if centre else None,
+        "lat": centre[1] if centre else None,
+        "tags": tags,
+    }
+    element.update(members)
+    return element
+
+
+def read_osm_pbf(path: str, osm_filter: OsmFilter) -> list[dict[str, Any]]:
+    """Read the wanted objects of an .osm.pbf file with osmium."""
+    if osmium is None:
+        raise ValueError("Reading .osm.pbf files needs the osmium package")
+
+    elements: list[dict[str, Any]] = []
+    relations: dict[int, dict[str, Any]] = {}
+
+    class Handler(osmium.SimpleHandler):
+        def node(self, n):
+            tags = {tag.k: tag.v for tag in n.tags}
+            if tags and osm_filter.wanted(tags):
+                elements.append(
+                    {
+                        "type": "node",
+                        "id": n.id,
+                        "version": n.version or None,
+                        "lon": n.location.lon,
+                        "lat": n.location.lat,
+                        "tags": tags,
+                    }
+                )
+
+        def way(self, w):
+            tags = {tag.k: tag.v for tag in w.tags}
+            if not osm_filter.wanted(tags):
+                return
+            points = [(nd.lon, nd.lat) for nd in w.nodes if nd.location.valid()]
+            lon, lat = _centre(points) or (None, None)
+            elements.append(
+                {
+                    "type": "way",
+                    "id": w.id,
+                    "version": w.version or None,
+                    "lon": lon,
+                    "lat": lat,
+                    "tags": tags,
+                    "nodes": [nd.ref for nd in w.nodes],
+                }
+            )
+
+        def relation(self, r):
+            tags = {tag.k: tag.v for tag in r.tags}
+            if osm_filter.wanted(tags):
+                relations[r.id] = {
+                    "type": "relation",
+                    "id": r.id,
+                    "version": r.version or None,
+                    "lon": None,
+                    "lat": None,
+                    "tags": tags,
+                    "members": [
+                        {"type": m.type, "ref": m.ref, "role": m.role}
+                        for m in r.members
+                    ],
+                }
+
+        def area(self, a):
+            relation = None if a.from_way() else relations.get(a.orig_id())
+            if relation is None:
+                return
+            points = [
+                (node.lon, node.lat)
+                for ring in a.outer_rings()
+                for node in ring
+                if node.location.valid()
+            ]
+            relation["lon"], relation["lat"] = _centre(points) or (None, None)
+
+    Handler().apply_file(path, locations=True)
+    elements.extend(relations.values())
+    # osmium reports member types as single letters
+    for relation in relations.values():
+        for member in relation["members"]:
+            member["type"] = {"n": "node", "w": "way", "r": "relation"}.get(
+                member["type"], member["type"]
+            )
+    return [element for element in elements if element["lon"] is not None]
+
+
+def read_osm(path: str, osm_filter: OsmFilter) -> list[dict[str, Any]]:
+    """Read the wanted objects of an OSM extract in either format."""
+    if path.endswith(".pbf"):
+        return read_osm_pbf(path, osm_filter)
+    return read_osm_xml(path, osm_filter)
+
+
+def distance(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    """Approximate the distance in metres between two nearby points."""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return EARTH_RADIUS * math.hypot(x, y)
+
+
+class GridIndex:
+    """Bucket points into fixed-size cells for radius searches."""
+
+    def __init__(self, cell_size: float = CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells: dict[tuple[int, int], list[int]] = defaultdict(list)
+
+    def _cell(self, lon: float, lat: float) -> tuple[int, int]:
+        return math.floor(lon / self.cell_size), math.floor(lat / self.cell_size)
+
+    def add(self, index: int, lon: float, lat: float) -> None:
+        """Add a point under the caller's index."""
+        self.cells[self._cell(lon, lat)].append(index)
+
+    def near(self, lon: float, lat: float, radius: float) -> Iterator[int]:
+        """Yield the indexes in every cell within `radius` metres of a point."""
+        lat_span = math.degrees(radius / EARTH_RADIUS)
+        lon_span = lat_span / max(math.cos(math.radians(lat)), 0.01)
+        x0, y0 = self._cell(lon - lon_span, lat - lat_span)
+        x1, y1 = self._cell(lon + lon_span, lat + lat_span)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield from self.cells.get((x, y), ())
+
+
+def score(
+    props: dict[str, Any], tags: dict[str, str], dist: float, radius: float
+) -> float | None:
+    """
+    Rate how likely an OSM object is the same place as an ATP feature.
+
+    Returns None when the two cannot be the same place.
+    """
+    same_brand = bool(props.get("brand:wikidata")) and tags.get(
+        "brand:wikidata"
+    ) == props.get("brand:wikidata")
+    names = {str(props[key]).casefold() for key in ("name", "brand") if props.get(key)}
+    same_name = any(
+        str(tags[key]).casefold() in names for key in ("name", "brand") if key in tags
+    )
+    if not same_brand and not same_name:
+        return None
+    if "brand:wikidata" in tags and not same_brand:
+        return None
+
+    total = 1 - dist / radius
+    if same_brand:
+        total += 1
+    elif same_name:
+        total += 0.5
+    if props.get("ref") and tags.get("ref") == str(props["ref"]):
+        total += 2
+    return total
+
+
+def match_features(
+    features: list[dict[str, Any]],
+    elements: list[dict[str, Any]],
+    radius: float = RADIUS,
+) -> dict[str, list[dict[str, Any]]]:
+    """
+    Sort features into matched, ambiguous and missing.
+
+    :param features: Cleaned ATP features
+    :param elements: OSM objects from `read_osm`
+    :param radius: Largest distance in metres to consider a match
+    :return: Features per output, annotated with their OSM match or candidates
+    """
+    grid = GridIndex()
+    for i, element in enumerate(elements):
+        grid.add(i, element["lon"], element["lat"])
+
+    results: dict[str, list[dict[str, Any]]] = {name: [] for name in OUTPUTS}
+    # the best match claimed for each OSM object, as (score, position, feature);
+    # matched is built from these once every claim is settled
+    claims: dict[int, tuple[float, int, dict[str, Any]]] = {}
+    for position, feature in enumerate(features):
+        lon, lat = feature["geometry"]["coordinates"][:2]
+        props = feature["properties"]
+        candidates = []
+        for i in grid.near(lon, lat, radius):
+            element = elements[i]
+            dist = distance(lon, lat, element["lon"], element["lat"])
+            if dist > radius:
+                continue
+            rating = score(props, element["tags"], dist, radius)
+            if rating is not None:
+                candidates.append((rating, dist, i))
+        candidates.sort(reverse=True)
+
+        if not candidates:
+            results["missing"].append(feature)
+        elif len(candidates) == 1 or candidates[0][0] - candidates[1][0] >= CLEAR_LEAD:
+            rating, dist, i = candidates[0]
+            feature["osm"] = elements[i]
+            feature["match"] = {"score": round(rating, 3), "distance": round(dist, 1)}
+            previous = claims.get(i)
+            if previous is None or rating > previous[0]:
+                if previous is not None:
+                    _demote(previous[2], results)
+                claims[i] = (rating, position, feature)
+            else:
+                _demote(feature, results)
+        else:
+            feature["candidates"] = [
+                {
+                    "type": elements[i]["type"],
+                    "id": elements[i]["id"],
+                    "score": round(rating, 3),
+                    "distance": round(dist, 1),
+                }
+                for rating, dist, i in candidates
+            ]
+            results["ambiguous"].append(feature)
+    results["matched"] = [
+        feature for _, _, feature in sorted(claims.values(), key=lambda c: c[1])
+    ]
+    return results
+
+
+def _demote(feature: dict[str, Any], results: dict[str, list[dict[str, Any]]]) -> None:
+    """Move a feature whose OSM object another feature claimed to ambiguous."""
+    element = feature.pop("osm")
+    match = feature.pop("match")
+    feature["candidates"] = [{"type": element["type"], "id": element["id"], **match}]
+    results["ambiguous"].append(feature)
+
+
+def read_features(paths: list[str]) -> list[dict[str, Any]]:
+    """Load the point features of cleaned GeoJSON files."""
+    features = []
+    for path in paths:
+        for feature in load(path).get("features", []):
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") == "Point":
+                features.append(feature)
+    return features
+
+
+def write_results(
+    results: dict[str, list[dict[str, Any]]], output_dir: str, fmt: str, gzip: bool
+) -> None:
+    """Write each output as its own FeatureCollection."""
+    os.makedirs(output_dir, exist_ok=True)
+    for name, features in results.items():
+        path = os.path.join(output_dir, name + ".geojson" + (".gz" if gzip else ""))
+        with open_text(path, "w") as f:
+            writer = FeatureCollectionWriter(f, fmt)
+            writer.members({"type": "FeatureCollection"})
+            writer.begin_features()
+            for feature in features:
+                writer.feature(feature)
+            writer.end_features()
+            writer.close()
+        print(f"{name.capitalize()}: {len(features)} features saved to {path}")
+
+
+def main():
+    """
+    Main CLI entry point for OSM matching.
+    """
+    parser = create_geojson_parser(description="Match ATP features to OSM objects")
+    parser.add_argument(
+        "--osm", required=True, help="OSM extract (.osm, .osm.gz or .osm.pbf)"
+    )
+    parser.add_argument(
+        "--radius",
+        type=float,
+        default=RADIUS,
+        help=f"Largest match distance in metres (default: {RADIUS})",
+    )
+
+    args = parser.parse_args()
+
+    if args.file:
+        paths = [args.file]
+    elif os.path.isdir(args.directory):
+        paths = [
+            os.path.join(args.directory, filename)
+            for filename in sorted(os.listdir(args.directory))
+            if is_geojson(filename) and not filename.startswith("missing")
+        ]
+    else:
+        print(
+            f"Error: Input directory does not exist: {args.directory}", file=sys.stderr
+        )
+        sys.exit(1)
+    output_dir = args.output or "build/match"
+
+    features = read_features(paths)
+    try:
+        elements = read_osm(args.osm, OsmFilter(features))
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Read {len(features)} ATP features and {len(elements)} OSM objects")
+
+    results = match_features(features, elements, args.radius)
+    write_results(results, output_dir, args.format, args.gzip)
+
+
+if __name__ == "__main__":
+    main()
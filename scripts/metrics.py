@@ -0,0 +1,200 @@
+"""
+Record what a run did, per file and in total, for scheduled jobs to graph.
+
+Each processed file appends a `file` record to a JSON lines log and each
+run ends with a `run` record of the totals. The same totals, with a few
+per-file gauges, can also be written as a Prometheus textfile for the
+node-exporter textfile collector.
+
+Example record:
+```
+{"type": "file", "tool": "clean", "run": "2024-05-01T06:00:00+00:00",
+ "file": "ihop.geojson", "status": "ok", "seconds": 0.41,
+ "features_in": 1687, "features_out": 1650, "features_dropped": 37,
+ "tags_removed": 5012, "features_per_second": 4114.6}
+```
+"""
+
+import argparse
+import datetime
+import json
+import os
+import time
+from collections import Counter
+from typing import Any
+
+PREFIX = "atp"
+
+# what each counter means, for the textfile's HELP lines
+DESCRIPTIONS = {
+    "features_in": "Features read",
+    "features_out": "Features written",
+    "features_dropped": "Features dropped outside the US",
+    "tags_removed": "Tags removed by cleaning",
+    "atlus_calls": "Calls made to the Atlus backend",
+    "atlus_errors": "Atlus calls or values that failed",
+    "cache_hits": "Values answered from the Atlus cache",
+    "groups": "Brand groups looked up in NSI",
+    "mismatch": "NSI groups with tags differing from NSI",
+    "ambiguous": "NSI groups matching several NSI entries",
+    "missing": "NSI groups without an NSI entry",
+}
+
+
+def _now() -> str:
+    """Return the current UTC time in ISO format."""
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+
+
+def _label(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RunMetrics:
+    """Collect per-file counters and write them as they come in."""
+
+    def __init__(self, tool: str, path: str | None = None, textfile: str | None = None):
+        self.tool = tool
+        self.path = path
+        self.textfile = textfile
+        self.run = _now()
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.totals: Counter[str] = Counter()
+        self.statuses: Counter[str] = Counter()
+        self.files: list[dict[str, Any]] = []
+
+    @classmethod
+    def from_args(cls, tool: str, args: argparse.Namespace) -> "RunMetrics":
+        """Create the metrics of a run from `add_metrics_arguments` options."""
+        return cls(tool, args.metrics, args.metrics_textfile)
+
+    def _write(self, record: dict[str, Any]) -> None:
+        """Append one record to the JSON lines log."""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def file(
+        self,
+        name: str,
+        counts: dict[str, int] | None = None,
+        seconds: float = 0.0,
+        status: str = "ok",
+    ) -> None:
+        """
+        Record one processed file.
+
+        :param name: File name
+        :param counts: Counters of the file, such as features_in
+        :param seconds: Time spent on the file
+        :param status: ok, unchanged, skipped or failed
+        """
+        counts = dict(counts or {})
+        self.totals.update(counts)
+        self.statuses[status] += 1
+        record = {
+            "type": "file",
+            "tool": self.tool,
+            "run": self.run,
+            "file": name,
+            "status": status,
+            "seconds": round(seconds, 4),
+            **counts,
+        }
+        if seconds and "features_in" in counts:
+            record["features_per_second"] = round(counts["features_in"] / seconds, 1)
+        self.files.append(record)
+        self._write(record)
+
+    def finish(self) -> dict[str, Any]:
+        """Write the run totals to the log and the textfile, and return them."""
+        seconds = time.perf_counter() - self._start
+        record = {
+            "type": "run",
+            "tool": self.tool,
+            "run": self.run,
+            "time": _now(),
+            "seconds": round(seconds, 4),
+            "files": dict(self.statuses),
+            **self.totals,
+        }
+        if seconds and "features_in" in self.totals:
+            record["features_per_second"] = round(
+                self.totals["features_in"] / seconds, 1
+            )
+        self._write(record)
+        if self.textfile:
+            self.write_textfile(record)
+        return record
+
+    def write_textfile(self, record: dict[str, Any]) -> None:
+        """Replace the Prometheus textfile with the totals of a run."""
+        name = f"{PREFIX}_{self.tool}"
+        lines = []
+
+        def gauge(metric: str, help_text: str, samples: list[tuple[str, Any]]):
+            lines.append(f"# HELP {name}_{metric} {help_text}")
+            lines.append(f"# TYPE {name}_{metric} gauge")
+            lines.extend(
+                f"{name}_{metric}{labels} {value}" for labels, value in samples
+            )
+
+        gauge(
+            "last_run_timestamp_seconds",
+            "When the last run started",
+            [("", round(self.started, 3))],
+        )
+        gauge("duration_seconds", "Duration of the last run", [("", record["seconds"])])
+        gauge(
+            "files",
+            "Files by status in the last run",
+            [
+                (f'{{status="{_label(s)}"}}', n)
+                for s, n in sorted(self.statuses.items())
+            ],
+        )
+        for key, value in self.totals.items():
+            gauge(key, f"{DESCRIPTIONS.get(key, key)} in the last run", [("", value)])
+        if "features_per_second" in record:
+            gauge(
+                "features_per_second",
+                "Features read per second in the last run",
+                [("", record["features_per_second"])],
+            )
+        for metric, help_text in (
+            ("file_seconds", "Time spent on each file"),
+            ("file_features_per_second", "Features read per second for each file"),
+        ):
+            key = metric.removeprefix("file_")
+            samples = [
+                (f'{{file="{_label(f["file"])}"}}', f[key])
+                for f in self.files
+                if f["status"] == "ok" and key in f
+            ]
+            if samples:
+                gauge(metric, f"{help_text} in the last run", samples)
+
+        # write then rename, so the collector never reads a partial file
+        os.makedirs(os.path.dirname(os.path.abspath(self.textfile)), exist_ok=True)
+        tmp_path = f"{self.textfile}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.textfile)
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the options choosing where metrics are written."""
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="Append per-file and per-run metrics to this JSON lines file",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        metavar="PATH",
+        help="Write run metrics to this Prometheus textfile (node-exporter)",
+    )
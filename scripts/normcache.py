@@ -0,0 +1,104 @@
+"""Memoize string normalization results across the files in a cleaning run."""
+
+import json
+import os
+from collections import OrderedDict
+from collections.abc import Callable
+
+
+class NormalizationCache:
+    """Bounded least-recently-used cache of normalized strings."""
+
+    def __init__(self, maxsize: int = 65536, version: str = ""):
+        self.maxsize = maxsize
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.track_new = False
+        self._entries: OrderedDict[tuple[str, str], str] = OrderedDict()
+        self._new: dict[tuple[str, str], str] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, kind: str, value: str, func: Callable[[str], str]) -> str:
+        """Return the cached result of `func(value)`, computing it on a miss."""
+        key = (kind, value)
+        try:
+            result = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            result = func(value)
+            self._put(key, result)
+            if self.track_new:
+                self._new[key] = result
+            return result
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return result
+
+    def _put(self, key: tuple[str, str], result: str) -> None:
+        """Store an entry, evicting the least recently used one if full."""
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def entries(self) -> list[tuple[str, str, str]]:
+        """Return every entry, least recently used first."""
+        return [
+            (kind, value, result) for (kind, value), result in self._entries.items()
+        ]
+
+    def update(self, entries: list[tuple[str, str, str]]) -> None:
+        """Add entries computed elsewhere, such as in a worker process."""
+        for kind, value, result in entries:
+            self._put((kind, value), result)
+
+    def drain(self) -> tuple[list[tuple[str, str, str]], int, int, int]:
+        """Return and reset the entries and counters gathered since the last drain."""
+        new = [(kind, value, result) for (kind, value), result in self._new.items()]
+        stats = (new, self.hits, self.misses, self.evictions)
+        self._new = {}
+        self.hits = self.misses = self.evictions = 0
+        return stats
+
+    def merge(self, drained: tuple[list[tuple[str, str, str]], int, int, int]) -> None:
+        """Fold the output of another cache's `drain` into this one."""
+        entries, hits, misses, evictions = drained
+        self.update(entries)
+        self.hits += hits
+        self.misses += misses
+        self.evictions += evictions
+
+    def load(self, path: str) -> None:
+        """Load persisted entries, ignoring files from another cleaning version."""
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            contents = json.load(f)
+        if contents.get("version") == self.version:
+            self.update(contents["entries"])
+
+    def save(self, path: str) -> None:
+        """Persist the entries so a later run can start warm."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "entries": self.entries()}, f)
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters."""
+        self._entries.clear()
+        self._new.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def summary(self) -> str:
+        """Describe the hit rate for console output."""
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups else 0.0
+        return (
+            f"Normalization cache: {self.hits} hits, {self.misses} misses "
+            f"({rate:.1f}% hit rate), {self.evictions} evictions, {len(self)} entries"
+        )
@@ -1,10 +1,33 @@
 """Allow checking ATP values against the NSI index."""
 
+import argparse
+import io
 import os
-from typing import Any
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from typing import Any, TextIO
 import json
 import requests
 
+from cli_utils import corpus_files
+from jsonstream import JSONStreamReader
+from metrics import RunMetrics, add_metrics_arguments
+from serialize import dump, load
+
+NSI_PATH = "scripts/json/nsi.json"
+INDEX_PATH = "scripts/json/nsi.sqlite"
+REPORT_PATH = "build/nsi_report.json"
+STATUSES = ["mismatch", "ambiguous", "missing"]
+NSI_URL = (
+    "https://raw.githubusercontent.com/osmlab/name-suggestion-index/main/dist/nsi.json"
+)
+
+_index: sqlite3.Connection | None = None
+_index_key: tuple | None = None
+
 
 class AmbiguousValueError(Exception):
     """Declare an ambiguous value error."""
@@ -14,6 +37,21 @@ class AmbiguousValueError(Exception):
         super().__init__(self.message)
 
 
+def _in_us(entry: dict) -> bool:
+    """Check whether an NSI entry's locationSet covers the US."""
+    location = entry["locationSet"]
+    return "us" in location["include"] or (
+        "001" in location["include"] and "us" not in location.get("exclude", [])
+    )
+
+
+def _strip(entry: dict) -> dict:
+    """Drop the NSI entry fields the checks never read."""
+    for rtag in ["id", "locationSet", "fromTemplate"]:
+        entry.pop(rtag, None)
+    return entry
+
+
 def only_needed(contents: dict) -> dict[Any, Any]:
     """Remove non-used data from NSI json."""
     contents["nsi"] = {
@@ -21,57 +59,236 @@ def only_needed(contents: dict) -> dict[Any, Any]:
     }
 
     for v in contents["nsi"].values():
-        a = []
-        for entry in v["items"]:
-            if "us" in entry["locationSet"]["include"] or (
-                "001" in entry["locationSet"]["include"]
-                and "us" not in entry["locationSet"].get("exclude", [])
-            ):
-                for rtag in ["id", "locationSet", "fromTemplate"]:
-                    entry.pop(rtag, None)
-                a.append(entry)
-        v["items"] = a
+        v["items"] = [_strip(entry) for entry in v["items"] if _in_us(entry)]
+    return contents
+
+
+def read_needed(stream: TextIO) -> dict[Any, Any]:
+    """
+    Parse an NSI dist file keeping only what `only_needed` would.
+
+    Categories other than brands are skipped and entries outside the US
+    dropped as they are read, so the full file is never held in memory.
+    """
+    reader = JSONStreamReader(stream)
+    contents: dict[str, Any] = {}
+    for key in reader.iter_object():
+        if key != "nsi":
+            contents[key] = reader.read_value()
+            continue
+        contents["nsi"] = {}
+        for category in reader.iter_object():
+            if not category.startswith("brands"):
+                reader.skip_value()
+                continue
+            members: dict[str, Any] = {}
+            for member in reader.iter_object():
+                if member == "items":
+                    members["items"] = [
+                        _strip(entry) for entry in reader.iter_array() if _in_us(entry)
+                    ]
+                else:
+                    members[member] = reader.read_value()
+            contents["nsi"][category] = members
     return contents
 
 
-def fetch_and_save_nsi_json(url: str, filename: str = "scripts/json/nsi.json"):
+def _validators(index_path: str) -> dict[str, str]:
+    """Return the HTTP validators stored with the current index."""
+    try:
+        with closing(sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)) as conn:
+            rows = conn.execute(
+                "SELECT name, value FROM meta WHERE name IN ('etag', 'last_modified')"
+            ).fetchall()
+    except sqlite3.Error:
+        return {}
+    return dict(rows)
+
+
+def refresh_nsi(
+    url: str = NSI_URL,
+    filename: str = NSI_PATH,
+    index_path: str = INDEX_PATH,
+    force: bool = False,
+    timeout: float = 30,
+) -> bool:
+    """
+    Download the NSI dist file if it changed and rebuild the index from it.
+
+    The request carries the ETag and Last-Modified of the previous download,
+    so an unchanged file costs one round trip. A new file is filtered while
+    it streams in and written compactly.
+
+    :param url: Location of the NSI dist file
+    :param filename: Where to save the filtered NSI json
+    :param index_path: Where to build the lookup index
+    :param force: Download even if the server reports no change
+    :param timeout: Seconds to wait for the server
+    :return: Whether new data was saved
+    """
+    headers = {}
+    if not force and os.path.exists(filename):
+        validators = _validators(index_path)
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    with requests.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+        response.raw.decode_content = True
+        contents = read_needed(io.TextIOWrapper(response.raw, encoding="utf-8"))
+        meta = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    tmp_path = f"{filename}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(contents, file, separators=(",", ":"))
+        os.replace(tmp_path, filename)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    build_index(filename, index_path, contents, meta)
+    return True
+
+
+def fetch_and_save_nsi_json(url: str = NSI_URL, filename: str = NSI_PATH):
     """Get the latest NSI json file."""
     try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            data = only_needed(response.json())
-            with open(filename, "w", encoding="utf-8") as file:
-                json.dump(data, file, indent=2)
+        if refresh_nsi(url, filename):
             print("JSON data saved successfully to", filename)
         else:
-            print(
-                "Failed to fetch JSON data from GitHub. Status code:",
-                response.status_code,
-            )
+            print("NSI data is up to date:", filename)
     except Exception as e:
         print("An error occurred:", e)
 
 
+def _source_stamp(source: str) -> str:
+    """Identify a version of the NSI json by its size and modification time."""
+    stat = os.stat(source)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _index_rows(contents: dict):
+    """Yield one index row per NSI brand entry."""
+    for category, v in contents["nsi"].items():
+        if not category.startswith("brands/"):
+            continue
+        key, _, value = category.removeprefix("brands/").partition("/")
+        for entry in v["items"]:
+            tags = entry["tags"]
+            yield (
+                key,
+                value,
+                tags.get("brand:wikidata"),
+                tags.get("brand"),
+                json.dumps(tags, separators=(",", ":")),
+            )
+
+
+def build_index(
+    source: str = NSI_PATH,
+    index_path: str = INDEX_PATH,
+    contents: dict | None = None,
+    meta: dict[str, str | None] | None = None,
+) -> None:
+    """Build the on-disk lookup index from the filtered NSI json."""
+    if contents is None:
+        with open(source, "r", encoding="utf-8") as file:
+            contents = json.load(file)
+
+    # build beside the target and swap it in so readers never see a partial index
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(
+            "CREATE TABLE entries (key TEXT, value TEXT, wikidata TEXT, brand TEXT, tags TEXT)"
+        )
+        conn.executemany(
+            "INSERT INTO entries VALUES (?, ?, ?, ?, ?)", _index_rows(contents)
+        )
+        conn.execute(
+            "CREATE INDEX entries_lookup ON entries (key, value, wikidata, brand)"
+        )
+        conn.execute("INSERT INTO meta VALUES ('source', ?)", (_source_stamp(source),))
+        # validators for conditional refreshes, dropped whenever the json changes
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [(name, value) for name, value in (meta or {}).items() if value],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, index_path)
+
+
+def _open_index(source: str = NSI_PATH, index_path: str = INDEX_PATH):
+    """Return a read-only connection to the index, rebuilding it if stale."""
+    global _index, _index_key
+
+    stamp = _source_stamp(source) if os.path.exists(source) else None
+    key = (os.getpid(), source, index_path, stamp)
+    if _index is not None and _index_key == key:
+        return _index
+
+    if stamp is not None:
+        try:
+            with closing(
+                sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+            ) as conn:
+                current = conn.execute(
+                    "SELECT value FROM meta WHERE name = 'source'"
+                ).fetchone()
+        except sqlite3.Error:
+            current = None
+        if current is None or current[0] != stamp:
+            build_index(source, index_path)
+    elif not os.path.exists(index_path):
+        raise FileNotFoundError(f"No NSI data found at {source} or {index_path}")
+
+    if _index is not None and _index_key[0] == os.getpid():
+        _index.close()
+    _index = sqlite3.connect(
+        f"file:{index_path}?mode=ro", uri=True, check_same_thread=False
+    )
+    _index.execute("PRAGMA mmap_size = 268435456")
+    _index_key = key
+    return _index
+
+
+def load_index() -> None:
+    """Open the NSI index ahead of the first lookup, rebuilding it if stale."""
+    _open_index()
+
+
 def get_nsi_tags(qwiki: str, base: str, value: str, brand: str | None):
     """Get the necessary NSI tags, given a wikidata identifier."""
-    with open("scripts/json/nsi.json", "r", encoding="utf-8") as file:
-        contents = json.load(file)
-        tags = [
-            i["tags"]
-            for i in contents["nsi"].get(f"brands/{base}/{value}")["items"]
-            if i["tags"].get("brand:wikidata") == qwiki
-        ]
-
-        if not tags:
-            raise ValueError(f"No NSI entries matching this wikidata: {qwiki}")
-        if len(tags) == 1:
-            return tags[0]
-        filt = [i for i in tags if i.get("brand") == brand]
-        if len(filt) == 1 and brand:
-            return filt[0]
-        raise AmbiguousValueError(
-            f"Multiple possible NSI entries matching this wikidata: {qwiki}"
+    rows = (
+        _open_index()
+        .execute(
+            "SELECT brand, tags FROM entries WHERE key = ? AND value = ? AND wikidata = ?",
+            (base, value, qwiki),
         )
+        .fetchall()
+    )
+
+    if not rows:
+        raise ValueError(f"No NSI entries matching this wikidata: {qwiki}")
+    if len(rows) == 1:
+        return json.loads(rows[0][1])
+    filt = [tags for entry_brand, tags in rows if entry_brand == brand]
+    if len(filt) == 1 and brand:
+        return json.loads(filt[0])
+    raise AmbiguousValueError(
+        f"Multiple possible NSI entries matching this wikidata: {qwiki}"
+    )
 
 
 def compare_dicts(
@@ -120,27 +337,175 @@ def nsi_check(contents: dict, file: str = "") -> None:
         pass
 
 
-def run_check() -> None:
-    FOLDER_PATH = "/Users/will/Downloads/output"
-
-    files = [
-        os.path.join(root, file)
-        for root, _, files in os.walk(FOLDER_PATH)
-        for file in files
-        if file.startswith("")
-        and file.endswith(".geojson")
-        and not file.startswith("missing")
-    ]
-    for file in files:
-        with open(file, "r", encoding="utf-8") as f:
-            try:
-                contents: dict = json.load(f)
-            except json.decoder.JSONDecodeError:
-                continue
-            nsi_check(contents, file)
+def validate_file(path: str) -> dict[str, Any]:
+    """
+    Check every feature of a file against NSI, one lookup per group.
+
+    Features are grouped by primary tag, brand:wikidata and brand; features
+    without a wikidata id or a primary tag are not checked.
+
+    :param path: GeoJSON file to check
+    :return: Counts of features and groups, a result per group with issues,
+        and the time taken
+    """
+    start = time.perf_counter()
+    contents = load(path)
+    groups: dict[tuple, list[dict[str, Any]]] = {}
+    for feature in contents.get("features", []):
+        tags = feature.get("properties") or {}
+        if not tags.get("brand:wikidata"):
+            continue
+        try:
+            k, v = get_primary_kv(tags)
+        except ValueError:
+            continue
+        groups.setdefault((k, v, tags["brand:wikidata"], tags.get("brand")), []).append(
+            tags
+        )
+
+    results = []
+    for (k, v, wikidata, brand), members in groups.items():
+        result = {
+            "file": os.path.relpath(path),
+            "key": k,
+            "value": v,
+            "brand:wikidata": wikidata,
+            "brand": brand,
+            "features": len(members),
+        }
+        try:
+            canon = get_nsi_tags(wikidata, k, v, brand)
+        except AmbiguousValueError:
+            results.append(result | {"status": "ambiguous"})
+            continue
+        except ValueError:
+            results.append(result | {"status": "missing"})
+            continue
+
+        mismatches: Counter[tuple] = Counter()
+        for tags in members:
+            for tag, values in compare_dicts(canon, tags).items():
+                mismatches[tag, values["nsi"], values["atp"]] += 1
+        if mismatches:
+            result["status"] = "mismatch"
+            result["mismatches"] = [
+                {"tag": tag, "nsi": nsi_value, "atp": atp_value, "features": count}
+                for (tag, nsi_value, atp_value), count in mismatches.most_common()
+            ]
+            results.append(result)
+
+    return {
+        "features": len(contents.get("features", [])),
+        "groups": len(groups),
+        "results": results,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def validate_corpus(
+    paths: list[str], jobs: int = 1, metrics: RunMetrics | None = None
+) -> dict[str, Any]:
+    """
+    Check every feature of every file against NSI.
+
+    :param paths: GeoJSON files to check
+    :param jobs: Number of worker processes (0 for one per CPU)
+    :param metrics: Run metrics to record each file in
+    :return: Totals, and the groups that are ambiguous, missing or mismatched
+    """
+    jobs = jobs or os.cpu_count() or 1
+    report: dict[str, Any] = {"files": 0, "features": 0, "groups": 0, "results": []}
+    if jobs <= 1:
+        checked = map(validate_file, paths)
+    else:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        checked = executor.map(validate_file, paths, chunksize=4)
+    try:
+        for path, result in zip(paths, checked):
+            report["files"] += 1
+            report["features"] += result["features"]
+            report["groups"] += result["groups"]
+            report["results"].extend(result["results"])
+            if metrics:
+                statuses = Counter(r["status"] for r in result["results"])
+                counts = {"features_in": result["features"], "groups": result["groups"]}
+                counts |= {status: statuses[status] for status in STATUSES}
+                metrics.file(os.path.relpath(path), counts, result["seconds"])
+    finally:
+        if jobs > 1:
+            executor.shutdown()
+    return report
+
+
+def main():
+    """
+    Main CLI entry point for NSI checks.
+    """
+    parser = argparse.ArgumentParser(description="Check ATP values against the NSI")
+    parser.add_argument(
+        "paths", nargs="*", default=["data"], help="Files or directories to check"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=REPORT_PATH,
+        help=f"Report file (default: {REPORT_PATH})",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=0,
+        help="Number of processes checking files (default: 0, one per CPU)",
+    )
+    parser.add_argument(
+        "--build-index",
+        action="store_true",
+        help=f"Rebuild {INDEX_PATH} from {NSI_PATH} and exit",
+    )
+    parser.add_argument(
+        "--refresh",
+        nargs="?",
+        const=NSI_URL,
+        metavar="URL",
+        help="Download the NSI dist file if it changed (default: GitHub) and exit",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="With --refresh, download even if the file is unchanged",
+    )
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    if args.build_index:
+        build_index()
+        print("NSI index saved to", INDEX_PATH)
+        return
+
+    if args.refresh:
+        if refresh_nsi(args.refresh, force=args.force):
+            print("NSI data saved to", NSI_PATH, "and indexed in", INDEX_PATH)
+        else:
+            print("NSI data is up to date")
+        return
+
+    # build the index once up front rather than racing to build it in workers
+    load_index()
+    metrics = RunMetrics.from_args("nsi", args)
+    report = validate_corpus(corpus_files(args.paths), args.jobs, metrics)
+    metrics.finish()
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    dump(report, args.output)
+
+    statuses = Counter(result["status"] for result in report["results"])
+    print(
+        f"Checked {report['features']} features in {report['groups']} groups "
+        f"across {report['files']} files: "
+        + ", ".join(f"{statuses[status]} {status}" for status in STATUSES)
+    )
+    print(f"Report saved to: {args.output}")
 
 
 if __name__ == "__main__":
-    # GITHUB_URL = "https://raw.githubusercontent.com/osmlab/name-suggestion-index/main/dist/nsi.json"
-    # fetch_and_save_nsi_json(GITHUB_URL)
-    run_check()
+    main()
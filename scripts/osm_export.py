@@ -0,0 +1,273 @@
+"""
+Write cleaned GeoJSON as OSM XML or osmChange without loading whole files.
+
+Example usage:
+```
+python scripts/osm_export.py build/match/missing.geojson -o data/missing.osm
+python scripts/osm_export.py build/match/matched.geojson --change -o build/tags.osc
+```
+
+OSM XML output uses the layout of data/missing.osm: new nodes with negative
+ids and their tags sorted by key. With --change, features the matcher
+paired with an OSM object become <modify> entries adding the ATP tags the
+object lacks; --create also turns unmatched features into <create> nodes.
+"""
+
+import argparse
+import os
+from collections.abc import Iterator
+from typing import Any, TextIO
+
+from cli_utils import is_geojson
+from jsonstream import read_collection
+from serialize import open_text
+
+GENERATOR = "atp-us-import"
+
+_ESCAPES = str.maketrans(
+    {
+        "&": "&amp;",
+        "<": "&lt;",
+        ">": "&gt;",
+        "'": "&apos;",
+        '"': "&quot;",
+        "\n": "&#10;",
+        "\r": "&#13;",
+        "\t": "&#9;",
+    }
+)
+
+
+def escape(value: Any) -> str:
+    """Escape a value for a single-quoted XML attribute."""
+    return str(value).translate(_ESCAPES)
+
+
+def coordinate(value: float) -> str:
+    """Format a coordinate as it appears in the GeoJSON input."""
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class OsmWriter:
+    """Stream nodes, ways and relations into an OSM or osmChange document."""
+
+    def __init__(self, stream: TextIO, change: bool = False):
+        self.stream = stream
+        self.change = change
+        self._action: str | None = None
+        self.counts: dict[str, int] = {}
+        stream.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+        if change:
+            stream.write(f"<osmChange version='0.6' generator='{GENERATOR}'>\n")
+        else:
+            stream.write(
+                f"<osm version='0.6' upload='false' generator='{GENERATOR}'>\n"
+            )
+
+    def _begin(self, action: str) -> str:
+        """Open the action block an element belongs in and return its indent."""
+        self.counts[action] = self.counts.get(action, 0) + 1
+        if not self.change:
+            return "  "
+        if action != self._action:
+            if self._action:
+                self.stream.write(f"  </{self._action}>\n")
+            self.stream.write(f"  <{action}>\n")
+            self._action = action
+        return "    "
+
+    def element(
+        self,
+        element: dict[str, Any],
+        tags: dict[str, str],
+        action: str = "create",
+    ) -> None:
+        """
+        Write one OSM object.
+
+        :param element: Object with type, id and version, plus lon/lat for
+            nodes, node ids for ways and members for relations
+        :param tags: Tags to write, in the order given
+        :param action: osmChange block to write the object in
+        """
+        pad = self._begin(action)
+        kind = element["type"]
+        attrs = f"id='{element['id']}'"
+        if element.get("version"):
+            attrs += f" version='{element['version']}'"
+        if kind == "node":
+            attrs += (
+                f" lat='{coordinate(element['lat'])}'"
+                f" lon='{coordinate(element['lon'])}'"
+            )
+
+        children = [f"<nd ref='{ref}' />" for ref in element.get("nodes", [])]
+        children += [
+            f"<member type='{m['type']}' ref='{m['ref']}' role='{escape(m['role'])}' />"
+            for m in element.get("members", [])
+        ]
+        children += [
+            f"<tag k='{escape(k)}' v='{escape(v)}' />" for k, v in tags.items()
+        ]
+        if not children:
+            self.stream.write(f"{pad}<{kind} {attrs} />\n")
+            return
+        self.stream.write(f"{pad}<{kind} {attrs}>\n")
+        for child in children:
+            self.stream.write(f"{pad}  {child}\n")
+        self.stream.write(f"{pad}</{kind}>\n")
+
+    def close(self) -> None:
+        """Close any open action block and the document."""
+        if self.change:
+            if self._action:
+                self.stream.write(f"  </{self._action}>\n")
+            self.stream.write("</osmChange>\n")
+        else:
+            self.stream.write("</osm>\n")
+
+
+def feature_tags(feature: dict[str, Any]) -> dict[str, str]:
+    """Turn a feature's properties into OSM tags sorted by key."""
+    return {
+        key: str(value)
+        for key, value in sorted(feature.get("properties", {}).items())
+        if not key.startswith("@") and value not in (None, "")
+    }
+
+
+def merged_tags(
+    osm_tags: dict[str, str], atp_tags: dict[str, str], overwrite: bool = False
+) -> dict[str, str]:
+    """Add ATP tags to an OSM object's tags, keeping its values unless asked."""
+    tags = dict(osm_tags)
+    for key, value in atp_tags.items():
+        if overwrite or key not in tags:
+            tags[key] = value
+    return dict(sorted(tags.items()))
+
+
+def iter_features(paths: list[str]) -> Iterator[dict[str, Any]]:
+    """Stream the features of GeoJSON files one at a time."""
+    for path in paths:
+        with open_text(path) as f:
+            for key, value in read_collection(f):
+                if key == "features":
+                    yield from value
+
+
+def export(
+    paths: list[str],
+    output_path: str,
+    change: bool = False,
+    create: bool = False,
+    overwrite: bool = False,
+    start_id: int = -1,
+) -> dict[str, int]:
+    """
+    Write features from GeoJSON files as OSM XML or osmChange.
+
+    :param paths: GeoJSON files from clean.py or match.py
+    :param output_path: .osm or .osc file to write, compressed if it ends in .gz
+    :param change: Write osmChange, modifying matched OSM objects
+    :param create: In osmChange, also create nodes for unmatched features
+    :param overwrite: Replace OSM tag values that differ from ATP's
+    :param start_id: Id of the first new node; later ones count down
+    :return: Number of objects written per action
+    """
+    next_id = start_id
+    skipped = 0
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open_text(output_path, "w") as out:
+        writer = OsmWriter(out, change)
+        for feature in iter_features(paths):
+            atp_tags = feature_tags(feature)
+            osm = feature.get("osm")
+            if change and osm:
+                tags = merged_tags(osm["tags"], atp_tags, overwrite)
+                if tags != dict(sorted(osm["tags"].items())):
+                    writer.element(osm, tags, "modify")
+                else:
+                    skipped += 1
+                continue
+            if change and (not create or "candidates" in feature):
+                continue
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") != "Point":
+                skipped += 1
+                continue
+            lon, lat = geometry["coordinates"][:2]
+            node = {"type": "node", "id": next_id, "lon": lon, "lat": lat}
+            writer.element(node, atp_tags, "create")
+            next_id -= 1
+        writer.close()
+    return writer.counts | {"skipped": skipped}
+
+
+def input_files(paths: list[str]) -> list[str]:
+    """Expand directories into the GeoJSON files they contain."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name)
+                for name in sorted(os.listdir(path))
+                if is_geojson(name)
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    """
+    Main CLI entry point for OSM export.
+    """
+    parser = argparse.ArgumentParser(description="Write GeoJSON as OSM XML")
+    parser.add_argument("paths", nargs="+", help="GeoJSON files or directories")
+    parser.add_argument(
+        "-o", "--output", required=True, help="Output .osm or .osc file"
+    )
+    parser.add_argument(
+        "--change",
+        action="store_true",
+        help="Write osmChange adding tags to the OSM objects matched by match.py",
+    )
+    parser.add_argument(
+        "--create",
+        action="store_true",
+        help="With --change, also create nodes for unmatched features",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="With --change, replace OSM tag values that differ from ATP's",
+    )
+    parser.add_argument(
+        "--start-id",
+        type=int,
+        default=-1,
+        help="Id of the first new node, counting down (default: -1)",
+    )
+
+    args = parser.parse_args()
+
+    if args.start_id >= 0:
+        parser.error("--start-id must be negative")
+
+    counts = export(
+        input_files(args.paths),
+        args.output,
+        change=args.change,
+        create=args.create,
+        overwrite=args.overwrite,
+        start_id=args.start_id,
+    )
+    print(
+        ", ".join(f"{count} {action}" for action, count in counts.items())
+        + f" written to: {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
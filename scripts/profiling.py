@@ -0,0 +1,87 @@
+"""Time the stages of a cleaning run when profiling is switched on."""
+
+import time
+from collections.abc import Callable
+from contextlib import nullcontext
+from functools import wraps
+
+# returned by Profiler.stage while disabled, so the off path allocates nothing
+_DISABLED = nullcontext()
+
+
+class _Timer:
+    """Context manager adding its elapsed time to a profiler stage."""
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+
+
+class Profiler:
+    """Accumulate wall time and call counts per named stage."""
+
+    def __init__(self, enabled: bool = False, output_dir: str | None = None):
+        self.enabled = enabled
+        self.output_dir = output_dir
+        self.stats: dict[str, list] = {}
+
+    def stage(self, name: str):
+        """Return a context manager timing one run of a stage."""
+        return _Timer(self, name) if self.enabled else _DISABLED
+
+    def record(self, name: str, seconds: float, calls: int = 1) -> None:
+        """Add time and calls to a stage."""
+        entry = self.stats.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    def seconds(self, name: str) -> float:
+        """Return the time recorded so far for a stage."""
+        return self.stats.get(name, [0.0, 0])[0]
+
+    def timed(self, name: str, func: Callable) -> Callable:
+        """Wrap a function so every call is recorded under `name`."""
+        if not self.enabled:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+
+        return wrapper
+
+    def drain(self) -> dict[str, tuple[float, int]]:
+        """Return and reset the statistics gathered so far."""
+        stats = {
+            name: (seconds, calls) for name, (seconds, calls) in self.stats.items()
+        }
+        self.stats = {}
+        return stats
+
+
+def format_profile(title: str, stats: dict[str, tuple[float, int]]) -> str:
+    """Lay out a per-stage breakdown, nesting `stage:part` entries under `stage`."""
+    top = [name for name in stats if ":" not in name]
+    total = sum(stats[name][0] for name in top)
+    lines = [f"\nProfile: {title} ({total:.3f} s)"]
+    for parent in top:
+        for name in [parent] + [n for n in stats if n.startswith(parent + ":")]:
+            seconds, calls = stats[name]
+            label = "  " + name.partition(":")[2] if ":" in name else name
+            share = 100 * seconds / total if total else 0.0
+            lines.append(
+                f"  {label:<24}{seconds:>10.4f} s{share:>7.1f}%{calls:>10} calls"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,248 @@
+"""
+Read and write GeoJSON with the fastest available JSON backend.
+
+orjson is used when it is installed, otherwise the standard library. Output
+does not depend on the backend: orjson's output is escaped as ``json.dumps``
+escapes it, and values orjson writes differently (floats below 1e-4,
+one-digit exponents) or cannot write (integers beyond 64 bits) go through
+the standard library. Three output layouts are available:
+
+- ``indent``: the two-space layout of ``json.dump(indent=2)``
+- ``prettier``: the layout `prettier` gives the files under data/
+- ``compact``: no whitespace at all
+
+Paths ending in ``.gz`` are compressed and decompressed transparently.
+"""
+
+import gzip
+import json
+import re
+from typing import IO, Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+FORMATS = ["indent", "prettier", "compact"]
+PRINT_WIDTH = 80
+
+# what json.dumps escapes beyond what orjson does
+_not_ascii = re.compile(r"[^\x00-\x7e]")
+# floats orjson writes as 0.00001 or 1e-7 where repr gives 1e-05 and 1e-07;
+# both start with a literal so the search stays fast
+_small_float = re.compile(r"0\.0000")
+_short_exponent = re.compile(r"e-\d(?!\w)")
+
+
+def _floats_differ(text: str) -> bool:
+    """
+    Check whether orjson output holds a float repr would write differently.
+
+    Matches inside strings only send a value to the slower path.
+    """
+    for match in _small_float.finditer(text):
+        if not text[match.start() - 1 : match.start()].isdigit():
+            return True
+    for match in _short_exponent.finditer(text):
+        if text[match.start() - 1 : match.start()].isdigit():
+            return True
+    return False
+
+
+def _escape(match: re.Match) -> str:
+    """Escape one character as \\uXXXX, as a surrogate pair beyond the BMP."""
+    code = ord(match.group())
+    if code < 0x10000:
+        return f"\\u{code:04x}"
+    code -= 0x10000
+    return f"\\u{0xD800 | code >> 10:04x}\\u{0xDC00 | code & 0x3FF:04x}"
+
+
+def _orjson_dumps(value: Any, option: int | None = None) -> str | None:
+    """
+    Serialize with orjson, escaped like the standard library's output.
+
+    Returns None when only the standard library gives the expected text.
+    """
+    try:
+        text = orjson.dumps(value, option=option).decode()
+    except TypeError:
+        return None
+    if _floats_differ(text):
+        return None
+    if text.isascii() and "\x7f" not in text:
+        return text
+    # outside strings JSON is plain ASCII, so only string contents change
+    return _not_ascii.sub(_escape, text)
+
+
+def open_text(path: str, mode: str = "r") -> IO[str]:
+    """Open a file for text reading or writing, through gzip if it ends in .gz."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def open_binary(path: str, mode: str = "rb") -> IO[bytes]:
+    """Open a file for binary reading or writing, through gzip if it ends in .gz."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def load(path: str) -> Any:
+    """Parse a whole JSON file."""
+    if orjson is not None:
+        with open_binary(path) as f:
+            return orjson.loads(f.read())
+    with open_text(path) as f:
+        return json.load(f)
+
+
+def dump(obj: Any, path: str, fmt: str = "indent") -> None:
+    """Serialize `obj` to `path` in the given layout."""
+    with open_binary(path, "wb") as f:
+        f.write(dumps(obj, fmt).encode("utf-8"))
+
+
+def dumps(obj: Any, fmt: str = "indent") -> str:
+    """Serialize a whole document in the given layout."""
+    if fmt == "prettier":
+        # prettier ends files with a newline
+        return dumps_value(obj, fmt) + "\n"
+    return dumps_value(obj, fmt)
+
+
+def dumps_value(
+    value: Any, fmt: str = "indent", level: int = 0, column: int = 0, trailing: int = 0
+) -> str:
+    """
+    Serialize a value nested `level` deep, starting at `column`.
+
+    `trailing` is the number of characters that follow the value on its last
+    line (a comma, for example); only the prettier layout needs to know.
+    """
+    if fmt == "compact":
+        text = _orjson_dumps(value) if orjson is not None else None
+        if text is None:
+            text = json.dumps(value, separators=(",", ":"))
+        return text
+    if fmt == "prettier":
+        return _prettier(value, level, column, trailing)
+    if fmt != "indent":
+        raise ValueError(f"Unknown output format: {fmt}")
+    text = _orjson_dumps(value, orjson.OPT_INDENT_2) if orjson is not None else None
+    if text is None:
+        text = json.dumps(value, indent=2)
+    return text.replace("\n", "\n" + "  " * level) if level else text
+
+
+_encode_string = json.encoder.encode_basestring_ascii
+
+
+def _scalar(value: Any) -> str:
+    """Serialize a non-container value with stdlib escaping."""
+    if isinstance(value, str):
+        return _encode_string(value)
+    if value is None or isinstance(value, bool):
+        return json.dumps(value)
+    if isinstance(value, int):
+        return int.__repr__(value)
+    return json.dumps(value)
+
+
+def _must_break(value: Any) -> bool:
+    """Check prettier's rule that lists of several multi-member objects always break."""
+    if isinstance(value, dict):
+        return any(_must_break(v) for v in value.values())
+    if isinstance(value, list):
+        if len(value) > 1 and (
+            all(isinstance(v, dict) and len(v) > 1 for v in value)
+            or all(isinstance(v, list) and len(v) > 1 for v in value)
+        ):
+            return True
+        return any(_must_break(v) for v in value)
+    return False
+
+
+def _flat(value: Any, budget: int) -> str | None:
+    """
+    Serialize a value on one line the way prettier prints a group that fits.
+
+    Returns None as soon as the text would be longer than `budget`.
+    """
+    if isinstance(value, dict):
+        if not value:
+            return "{}"
+        parts = []
+        used = 4
+        for k, v in value.items():
+            key = _scalar(k)
+            item = _flat(v, budget - used - len(key) - 2)
+            if item is None:
+                return None
+            parts.append(f"{key}: {item}")
+            used += len(parts[-1]) + 2
+            if used - 2 > budget:
+                return None
+        return "{ " + ", ".join(parts) + " }"
+    if isinstance(value, list):
+        parts = []
+        used = 2
+        for v in value:
+            item = _flat(v, budget - used)
+            if item is None:
+                return None
+            parts.append(item)
+            used += len(item) + 2
+            if used - 2 > budget:
+                return None
+        return "[" + ", ".join(parts) + "]"
+    text = _scalar(value)
+    return text if len(text) <= budget else None
+
+
+def _prettier(value: Any, level: int, column: int, trailing: int) -> str:
+    """Lay out a value the way prettier formats JSON at the default print width."""
+    if not isinstance(value, (dict, list)):
+        return _scalar(value)
+    if not value:
+        return "{}" if isinstance(value, dict) else "[]"
+
+    if not _must_break(value):
+        flat = _flat(value, PRINT_WIDTH - column - trailing)
+        if flat is not None:
+            return flat
+
+    pad = "  " * (level + 1)
+    if isinstance(value, dict):
+        items = list(value.items())
+        lines = []
+        for i, (key, item) in enumerate(items):
+            prefix = f"{pad}{_scalar(key)}: "
+            comma = "," if i < len(items) - 1 else ""
+            lines.append(
+                prefix + _prettier(item, level + 1, len(prefix), len(comma)) + comma
+            )
+        return "{\n" + "\n".join(lines) + "\n" + "  " * level + "}"
+
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+        # numbers fill each line as far as the print width allows
+        lines = []
+        line = ""
+        for i, item in enumerate(value):
+            text = _scalar(item) + ("," if i < len(value) - 1 else "")
+            if line and len(pad) + len(line) + 1 + len(text) > PRINT_WIDTH:
+                lines.append(pad + line)
+                line = text
+            else:
+                line = f"{line} {text}" if line else text
+        lines.append(pad + line)
+        return "[\n" + "\n".join(lines) + "\n" + "  " * level + "]"
+
+    lines = []
+    for i, item in enumerate(value):
+        comma = "," if i < len(value) - 1 else ""
+        lines.append(pad + _prettier(item, level + 1, len(pad), len(comma)) + comma)
+    return "[\n" + "\n".join(lines) + "\n" + "  " * level + "]"
@@ -0,0 +1,297 @@
+"""
+Keep the cleaning code warm in one process and serve it over a Unix socket or HTTP.
+
+Example usage:
+```
+python scripts/server.py
+python scripts/server.py --port 8765 --cache build/names.json
+```
+
+Imports, compiled patterns, the normalization cache, the NSI index and the
+Atlus backend are set up once and reused by every request, so a call made
+with client.py costs only the cleaning itself. Files are read and written
+by the server; requests are handled one at a time.
+
+Endpoints:
+- POST /clean: clean.py on a file or directory
+- POST /atlus: atlusfile.py on a file or directory
+- GET /status: version, uptime and request counts
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import signal
+import socketserver
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any
+
+import atlusfile
+from atlus_cache import CACHE_PATH, AtlusCache
+from atlus_client import API_URL, AtlusBackend, AtlusClient
+from clean import (
+    VERSION,
+    SkipFileError,
+    normalize_cache,
+    process_directory,
+    process_file,
+    select_rules,
+)
+from client import SOCKET_PATH
+from nsi import load_index
+
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+    """Serve HTTP requests on a Unix domain socket."""
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # handlers log the client address, which a Unix socket does not have
+        return request, ("local", 0)
+
+
+class CleaningService:
+    """Run cleaning requests against state kept between them."""
+
+    def __init__(
+        self,
+        atlus_backend: str = "http",
+        api_url: str = API_URL,
+        atlus_cache: str | None = CACHE_PATH,
+    ):
+        self.atlus_backend = atlus_backend
+        self.api_url = api_url
+        self.atlus_cache = atlus_cache
+        self._client: AtlusBackend | None = None
+        self._cache: AtlusCache | None = None
+        self.started = time.time()
+        self.requests: dict[str, int] = {}
+
+    def warm_up(self) -> None:
+        """Open the NSI index so the first request does not pay for it."""
+        try:
+            load_index()
+        except FileNotFoundError as e:
+            print(f"NSI checks disabled: {e}")
+
+    def clean(self, request: dict[str, Any]) -> dict[str, Any]:
+        """Clean a file or directory like clean.py."""
+        rules = select_rules(request.get("rules"), request.get("skip_rules"))
+        input_path, output_path = request["input"], request["output"]
+        fmt = request.get("format", "indent")
+        shards = request.get("shards", 1) or os.cpu_count() or 1
+        if os.path.isfile(input_path):
+            try:
+                process_file(
+                    input_path,
+                    output_path,
+                    request.get("stream", False),
+                    rules,
+                    fmt,
+                    shards,
+                )
+            except SkipFileError:
+                return {"skipped": True}
+            return {}
+        failed = process_directory(
+            input_path,
+            output_path,
+            jobs=request.get("jobs", 1),
+            stream=request.get("stream", False),
+            rules=rules,
+            force=request.get("force", False),
+            fmt=fmt,
+            gzip=request.get("gzip", False),
+            shards=shards,
+        )
+        return {"failed": failed}
+
+    def atlus(self, request: dict[str, Any]) -> dict[str, Any]:
+        """Parse addresses or phones of a file or directory like atlusfile.py."""
+        if self._client is None:
+            if self.atlus_backend == "local":
+                from atlus_local import LocalAtlusBackend
+
+                self._client = LocalAtlusBackend()
+            else:
+                self._client = AtlusClient(api_url=self.api_url)
+            if self.atlus_cache:
+                self._cache = AtlusCache(self.atlus_cache)
+        input_path, output_path = request["input"], request["output"]
+        field = request.get("field", "address")
+        fmt = request.get("format", "indent")
+        if os.path.isfile(input_path):
+            atlusfile.process_file(
+                input_path, output_path, field, self._client, self._cache, fmt
+            )
+        else:
+            atlusfile.process_directory(
+                input_path,
+                output_path,
+                field,
+                self._client,
+                self._cache,
+                fmt,
+                request.get("gzip", False),
+            )
+        return {}
+
+    def status(self) -> dict[str, Any]:
+        """Describe the server."""
+        return {
+            "version": VERSION,
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started, 1),
+            "requests": self.requests,
+            "cache": normalize_cache.summary(),
+        }
+
+    def handle(self, route: str, request: dict[str, Any]) -> tuple[int, dict]:
+        """Run one request, capturing what it prints."""
+        missing = [key for key in ("input", "output") if not request.get(key)]
+        if missing:
+            return 400, {"error": f"Missing request fields: {', '.join(missing)}"}
+        self.requests[route] = self.requests.get(route, 0) + 1
+        log = io.StringIO()
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+                result = getattr(self, route)(request)
+            code = 200
+        except Exception as e:
+            code, result = 500, {"error": f"{type(e).__name__}: {e}"}
+        result["log"] = log.getvalue()
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        return code, result
+
+    def close(self) -> None:
+        """Release the Atlus backend and cache."""
+        if self._client is not None and hasattr(self._client, "close"):
+            self._client.close()
+        if self._cache is not None:
+            self._cache.close()
+
+
+def make_handler(service: CleaningService) -> type[BaseHTTPRequestHandler]:
+    """Build a request handler class bound to a service."""
+
+    class Handler(BaseHTTPRequestHandler):
+        server_version = f"atp-clean/{VERSION}"
+
+        def _reply(self, code: int, body: dict[str, Any]) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/status":
+                self._reply(200, service.status())
+            else:
+                self._reply(404, {"error": f"Unknown endpoint: {self.path}"})
+
+        def do_POST(self):
+            route = self.path.strip("/")
+            if route not in ("clean", "atlus"):
+                self._reply(404, {"error": f"Unknown endpoint: {self.path}"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError as e:
+                self._reply(400, {"error": f"Invalid JSON: {e}"})
+                return
+            self._reply(*service.handle(route, request))
+
+        def log_message(self, format, *args):
+            print(f"{self.log_date_time_string()} {format % args}")
+
+    return Handler
+
+
+def main():
+    """
+    Main CLI entry point for the cleaning server.
+    """
+    parser = argparse.ArgumentParser(description="Serve cleaning requests")
+    parser.add_argument(
+        "--socket",
+        default=SOCKET_PATH,
+        help=f"Unix socket to listen on (default: {SOCKET_PATH})",
+    )
+    parser.add_argument(
+        "--port", type=int, help="Listen on this localhost TCP port instead"
+    )
+    parser.add_argument(
+        "--cache",
+        help="File to load normalized names from at start and save them to at exit",
+    )
+    parser.add_argument(
+        "--atlus-backend",
+        choices=["http", "local"],
+        default="http",
+        help="Backend for /atlus requests (default: http)",
+    )
+    parser.add_argument(
+        "--api-url",
+        default=API_URL,
+        help=f"Atlus API base URL (default: {API_URL})",
+    )
+    parser.add_argument(
+        "--atlus-cache",
+        default=CACHE_PATH,
+        help=f"SQLite cache of earlier Atlus results (default: {CACHE_PATH})",
+    )
+    parser.add_argument(
+        "--no-atlus-cache",
+        action="store_true",
+        help="Send every value to the Atlus API without consulting the cache",
+    )
+
+    args = parser.parse_args()
+
+    if args.cache and os.path.exists(args.cache):
+        normalize_cache.load(args.cache)
+    service = CleaningService(
+        args.atlus_backend,
+        args.api_url,
+        None if args.no_atlus_cache else args.atlus_cache,
+    )
+    service.warm_up()
+
+    handler = make_handler(service)
+    if args.port:
+        server = HTTPServer(("127.0.0.1", args.port), handler)
+        address = f"http://127.0.0.1:{args.port}"
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(args.socket)), exist_ok=True)
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixHTTPServer(args.socket, handler)
+        address = args.socket
+
+    # stop cleanly on SIGTERM as well as Ctrl-C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"Cleaning server {VERSION} listening on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if not args.port and os.path.exists(args.socket):
+            os.remove(args.socket)
+        if args.cache:
+            normalize_cache.save(args.cache)
+        print(normalize_cache.summary())
+
+
+if __name__ == "__main__":
+    main()